@@ -0,0 +1,7 @@
+"""
+Reusable pieces of the Uber pickup and car-mpg case studies.
+
+The notebook exports (uber_case_study.py, linear regression .py) stay as
+they are; the modules here hold the parts that have to scale past the
+sample files.
+"""
@@ -0,0 +1,173 @@
+"""
+Columnar on-disk cache of the cleaned pickup frame.
+
+The cleaned frame is written as an uncompressed Arrow IPC (feather v2)
+file named after a hash of the source file and of the source code of
+the loader and the cleaning steps (with the helpers, classes and schema
+constants such as DTYPES they use). Later runs memory-map the file and
+read only the columns they ask for; the cache is rebuilt only when the
+source file or the pipeline changes.
+
+read_frame() and write_frame() are the one reader and writer of that
+format; analysis.sharding and analysis.dag store their frames with them.
+"""
+import hashlib
+import inspect
+import os
+import tempfile
+
+from analysis.cleaning import STEPS, clean_pickups
+from analysis.loader import load_pickups
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+
+CACHE_VERSION = 1
+BLOCKSIZE = 1 << 20
+
+
+def file_digest(path):
+    """sha256 of the file contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(BLOCKSIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_frame(path, columns=None):
+    """
+    Frame of an Arrow IPC file, memory-mapped
+    columns: columns to read (default all)
+    """
+    return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+
+def write_frame(df, path, index=False):
+    """
+    Write df to path as an uncompressed Arrow IPC file, through a
+    temporary file renamed into place so readers never see half a file
+    index: store the index too (default False)
+    """
+    handle, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    os.close(handle)
+    try:
+        feather.write_feather(pa.Table.from_pandas(df, preserve_index=index), tmp, compression='uncompressed')
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _names(code):
+    """Global names a code object and the functions, lambdas and comprehensions nested in it refer to"""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _names(const)
+    return names
+
+
+# instrumentation does not change what a step computes, and its state
+# (profiling on or off) must not change keys
+UNHASHED = ('analysis.profiling',)
+
+
+def _ours(value):
+    module = value.__name__ if inspect.ismodule(value) else getattr(value, '__module__', None)
+    return isinstance(module, str) and module.startswith('analysis.') and module not in UNHASHED
+
+
+def _hash_value(value, digest, seen):
+    """Hash what a step depends on through one of its globals or defaults"""
+    if inspect.ismodule(value):
+        # a module used as a namespace (features.extract_date_parts): all of it
+        if _ours(value) and value not in seen:
+            seen.add(value)
+            digest.update(inspect.getsource(value).encode())
+    elif inspect.isclass(value):
+        if _ours(value) and value not in seen:
+            seen.add(value)
+            digest.update(inspect.getsource(value).encode())
+            for member in vars(value).values():
+                member = getattr(member, '__func__', getattr(member, 'fget', member))
+                if inspect.isfunction(member):
+                    _hash_source(member, digest, seen)
+    elif callable(value):
+        if inspect.isfunction(inspect.unwrap(value)) and _ours(inspect.unwrap(value)):
+            _hash_source(value, digest, seen)
+    elif isinstance(value, (list, tuple)) and any(callable(item) for item in value):
+        for item in value:
+            _hash_value(item, digest, seen)
+    else:
+        # module constants such as DTYPES or DATETIME_FORMAT; reprs with an
+        # address would change every run and are left out
+        text = repr(sorted(value, key=repr) if isinstance(value, (set, frozenset)) else value)
+        if ' at 0x' not in text:
+            digest.update(text.encode())
+
+
+def _hash_source(func, digest, seen):
+    # hash what a decorator (e.g. analysis.profiling.profiled) wraps, not the wrapper
+    func = inspect.unwrap(func)
+    if func in seen:
+        return
+    seen.add(func)
+    digest.update(inspect.getsource(func).encode())
+    # follow what the step reads from analysis.*: the functions it calls,
+    # the classes it uses (every method), module constants and defaults, so
+    # editing a helper such as PickupCube.update or DTYPES also counts
+    for value in func.__defaults__ or ():
+        _hash_value(value, digest, seen)
+    for name in sorted(_names(func.__code__)):
+        if name not in func.__globals__:
+            continue
+        value = func.__globals__[name]
+        if func.__module__.startswith('analysis.') or _ours(value) or inspect.ismodule(value):
+            _hash_value(value, digest, seen)
+
+
+def steps_digest(steps):
+    """sha256 of the source code of every step and the helpers it calls, in order"""
+    digest = hashlib.sha256(str(CACHE_VERSION).encode())
+    seen = set()
+    for step in steps:
+        _hash_source(step, digest, seen)
+    return digest.hexdigest()
+
+
+class CleanCache:
+    """
+    Cache of analysis.cleaning.clean_pickups(load_pickups(source))
+    directory: where the cache files are kept
+    steps: cleaning steps (default analysis.cleaning.STEPS)
+    """
+
+    def __init__(self, directory, steps=STEPS):
+        if pa is None:
+            raise ImportError("CleanCache needs pyarrow (pip install pyarrow)")
+        self.directory = directory
+        self.steps = list(steps)
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, source):
+        # load_pickups runs in build() too, its schema is part of the key
+        key = hashlib.sha256((file_digest(source) + steps_digest([load_pickups] + self.steps)).encode()).hexdigest()
+        return os.path.join(self.directory, key[:32] + '.arrow')
+
+    def build(self, source, path):
+        write_frame(clean_pickups(load_pickups(source), self.steps), path)
+
+    def load(self, source, columns=None):
+        """
+        Cleaned frame for source, built on the first call
+        source: pickup csv
+        columns: columns to read (default all)
+        """
+        path = self.path_for(source)
+        if not os.path.exists(path):
+            self.build(source, path)
+        return read_frame(path, columns)
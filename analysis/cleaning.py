@@ -0,0 +1,43 @@
+"""
+Cleaning steps of uber_case_study.py as plain functions.
+
+Each step takes the frame, changes it in place and returns it, so the
+steps can be chained and hashed (see analysis.cache).
+"""
+from analysis.features import extract_date_parts
+from analysis.loader import DATETIME_COLUMN
+from analysis.profiling import stage
+
+
+def add_date_parts(df):
+    """Extract year, month, hour, day and weekday from pickup_dt and drop it"""
+    return extract_date_parts(df, DATETIME_COLUMN, drop=True)
+
+
+def fill_borough(df):
+    """Missing borough becomes its own 'Unknown' category"""
+    if 'Unknown' not in df['borough'].cat.categories:
+        df['borough'] = df['borough'].cat.add_categories('Unknown')
+    df['borough'] = df['borough'].fillna('Unknown')
+    return df
+
+
+def fill_temp(df):
+    """Missing temp is filled with the Brooklyn mean, as in the notebook"""
+    df['temp'] = df['temp'].fillna(df.loc[df['borough'] == 'Brooklyn', 'temp'].mean())
+    return df
+
+
+STEPS = [add_date_parts, fill_borough, fill_temp]
+
+
+def clean_pickups(df, steps=STEPS):
+    """
+    Run the cleaning steps over a typed pickup frame
+    df: frame from analysis.loader
+    steps: list of step functions (default STEPS)
+    """
+    for step in steps:
+        with stage(step.__name__, rows=len(df)):
+            df = step(df)
+    return df
@@ -0,0 +1,117 @@
+"""
+Incremental Pearson correlation matrix.
+
+The heatmap cell runs df[num_var].corr() twice over all rows, and the
+matrix is recomputed whenever an hour of new data lands.
+CorrelationAccumulator keeps pairwise counts, sums and co-moments of the
+columns, so a new batch is folded in with a few k x k matrix products and
+accumulators from different partitions merge in O(k^2). Missing values
+are skipped pair by pair, exactly as DataFrame.corr() does.
+
+Sums are kept about a fixed per-column shift (the first batch's mean) so
+large offsets such as slp ~ 1000 do not cancel out the variance.
+"""
+import numpy as np
+import pandas as pd
+
+NUM_VAR = ['pickups', 'spd', 'vsb', 'temp', 'dewp', 'slp', 'pcp01', 'pcp06', 'pcp24', 'sd']
+
+
+class CorrelationAccumulator:
+    """
+    Running pairwise statistics of numeric columns
+    columns: columns to correlate (default the notebook's num_var)
+    """
+
+    def __init__(self, columns=NUM_VAR):
+        self.columns = list(columns)
+        k = len(self.columns)
+        self.shift = None
+        self.n = np.zeros((k, k))
+        # sx[i, j]: sum of x_i over rows where x_i and x_j are both present
+        self.sx = np.zeros((k, k))
+        self.sxx = np.zeros((k, k))
+        # sxy[i, j]: sum of x_i * x_j over rows where both are present
+        self.sxy = np.zeros((k, k))
+
+    def update(self, frame):
+        """Fold the rows of a dataframe into the statistics"""
+        values = frame[self.columns].to_numpy(dtype=np.float64)
+        if not len(values):
+            return self
+        if self.shift is None:
+            self.shift = np.nan_to_num(np.nanmean(values, axis=0)) if np.isfinite(values).any() \
+                else np.zeros(len(self.columns))
+        valid = ~np.isnan(values)
+        centered = np.where(valid, values - self.shift, 0.0)
+        present = valid.astype(np.float64)
+        self.n += present.T @ present
+        self.sx += centered.T @ present
+        self.sxx += (centered * centered).T @ present
+        self.sxy += centered.T @ centered
+        return self
+
+    def _reshift(self, shift):
+        # move the sums from the current shift to a new one
+        d = (self.shift - shift)[:, None]
+        sx = self.sx
+        self.sxy = self.sxy + d.T * sx + d * sx.T + d * d.T * self.n
+        self.sxx = self.sxx + 2 * d * sx + d * d * self.n
+        self.sx = sx + d * self.n
+        self.shift = shift
+
+    def merge(self, other):
+        """Add the statistics of another accumulator over the same columns"""
+        if other.columns != self.columns:
+            raise ValueError("cannot merge accumulators over different columns")
+        if other.shift is None:
+            return self
+        if self.shift is None:
+            self.shift = other.shift.copy()
+        other = other.copy()
+        other._reshift(self.shift)
+        self.n += other.n
+        self.sx += other.sx
+        self.sxx += other.sxx
+        self.sxy += other.sxy
+        return self
+
+    def copy(self):
+        result = CorrelationAccumulator(self.columns)
+        result.shift = None if self.shift is None else self.shift.copy()
+        result.n, result.sx, result.sxx, result.sxy = self.n.copy(), self.sx.copy(), self.sxx.copy(), self.sxy.copy()
+        return result
+
+    def _frame(self, values):
+        return pd.DataFrame(values, index=self.columns, columns=self.columns)
+
+    def count(self):
+        """Pairwise number of complete rows"""
+        return self._frame(self.n.astype(np.int64))
+
+    def mean(self):
+        """Mean of every column over its present values"""
+        shift = self.shift if self.shift is not None else np.zeros(len(self.columns))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return pd.Series(np.diag(self.sx) / np.diag(self.n) + shift, index=self.columns)
+
+    def cov(self):
+        """Pairwise sample covariance, as DataFrame.cov()"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            comoment = self.sxy - self.sx * self.sx.T / self.n
+            return self._frame(np.where(self.n > 1, comoment / (self.n - 1), np.nan))
+
+    def corr(self, min_periods=1):
+        """
+        Pairwise Pearson correlation, the frame sns.heatmap takes
+        min_periods: minimum complete rows per pair (default 1, as pandas)
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            comoment = self.sxy - self.sx * self.sx.T / self.n
+            var = self.sxx - self.sx * self.sx / self.n
+            corr = comoment / np.sqrt(np.maximum(var, 0) * np.maximum(var.T, 0))
+        corr = np.clip(corr, -1, 1)
+        corr[(self.n < max(min_periods, 2))] = np.nan
+        diagonal = np.diag_indices(len(self.columns))
+        corr[diagonal] = np.where(np.isnan(corr[diagonal]), np.nan, 1.0)
+        return self._frame(corr)
@@ -0,0 +1,106 @@
+"""
+Repeated k-fold cross-validation of OLS from Gram matrices.
+
+The car model rests on a single train_test_split. cross_validate scores
+repeated k-fold splits without refitting from raw rows: the Gram matrix
+of [1, X, y] is built once over all rows, the training Gram of a fold is
+that minus the fold's own Gram, and the held-out error follows from the
+fold's Gram alone (SSE = wᵀ G_fold w with w = [b, -1]).
+
+Every (repeat, fold) pair is a task for a process pool; the rows live
+once in shared memory and every worker maps them instead of receiving a
+copy.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from analysis.ols import OLSAccumulator
+
+_shared = {}
+
+
+def fold_ids(n, k, seed):
+    """Fold number of each of n rows for one shuffled k-fold split"""
+    ids = np.arange(n) % k
+    np.random.default_rng(seed).shuffle(ids)
+    return ids
+
+
+def _attach(name, shape, dtype):
+    block = shared_memory.SharedMemory(name=name)
+    _shared['block'] = block
+    _shared['z'] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _score_fold(task):
+    repeat, fold, seed, k, names, shift, intercept, full = task
+    z = _shared['z']
+    rows = z[fold_ids(len(z), k, seed) == fold]
+    held = rows.T @ rows
+    accumulator = OLSAccumulator(names, intercept)
+    accumulator.shift, accumulator.gram = shift, full - held
+    result = accumulator.fit()
+    slopes = result.coef.to_numpy()
+    # the fitted line in the shifted coordinates the Gram matrices use
+    offset = result.intercept - shift[-1] + slopes @ shift[:-1] if intercept else 0.0
+    w = np.concatenate([[offset], slopes, [-1.0]])
+    n = held[0, 0]
+    sse = w @ held @ w
+    tss = held[-1, -1] - held[0, -1] ** 2 / n
+    return {'repeat': repeat, 'fold': fold, 'n_test': len(rows), 'train_r2': result.rsquared,
+            'r2': 1.0 - sse / tss, 'mse': sse / n}
+
+
+class CVResult:
+    """Per-fold scores of a cross-validation run"""
+
+    def __init__(self, folds):
+        self.folds = folds
+
+    def summary(self):
+        """Mean and standard deviation of R^2 and MSE over all folds"""
+        return self.folds[['train_r2', 'r2', 'mse']].agg(['mean', 'std']).T
+
+
+def cross_validate(x, y, k=5, repeats=1, seed=1, intercept=True, workers=None):
+    """
+    Repeated k-fold cross-validation of y ~ x
+    x: frame of regressors
+    y: series or 1-D array of the target
+    k: folds per repeat (default 5)
+    repeats: number of reshuffled repeats (default 1)
+    seed: seed of the first repeat, repeat r uses seed + r (default 1)
+    intercept: fit an intercept (default True)
+    workers: processes in the pool (default os.cpu_count(); 1 runs in process)
+
+    Returns a CVResult with one row per (repeat, fold).
+    """
+    names = list(x.columns)
+    values = np.hstack([x.to_numpy(dtype=np.float64), np.asarray(y, dtype=np.float64).reshape(-1, 1)])
+    shift = values.mean(axis=0) if intercept else np.zeros(values.shape[1])
+    z = np.hstack([np.ones((len(values), 1)), values - shift])
+    full = z.T @ z
+    tasks = [(r, fold, seed + r, k, names, shift, intercept, full) for r in range(repeats) for fold in range(k)]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        _shared['z'] = z
+        try:
+            rows = [_score_fold(task) for task in tasks]
+        finally:
+            _shared.clear()
+    else:
+        block = shared_memory.SharedMemory(create=True, size=z.nbytes)
+        try:
+            np.ndarray(z.shape, dtype=z.dtype, buffer=block.buf)[:] = z
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_attach,
+                                     initargs=(block.name, z.shape, z.dtype)) as pool:
+                rows = list(pool.map(_score_fold, tasks))
+        finally:
+            block.close()
+            block.unlink()
+    return CVResult(pd.DataFrame(rows))
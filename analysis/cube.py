@@ -0,0 +1,213 @@
+"""
+Pre-aggregated hourly pickup cube.
+
+The notebook answers the same questions by scanning every row
+(groupby(['borough','hday'])['pickups'].mean(), sums by month, day, hour
+and weekday, per-borough hourly lines). PickupCube keeps count, sum, sum
+of squares, min and max of pickups over
+borough x month x day-of-month x hour x weekday x holiday as dense arrays,
+answers every roll-up from those cells and is updated in place as new
+hourly rows arrive.
+
+Rows with a missing key (borough not yet filled, no pickup time) or
+missing pickups are left out, as DataFrame.groupby leaves out missing
+keys, and counted in PickupCube.dropped.
+"""
+import numpy as np
+import pandas as pd
+
+from analysis.features import MONTHS, WEEKDAYS
+from analysis.profiling import profiled
+
+DIMS = ['borough', 'start_month', 'start_day', 'start_hour', 'week_day', 'hday']
+HDAY = ['N', 'Y']
+
+
+class PickupCube:
+    """
+    Dense count/sum/sumsq/min/max cube of pickups
+    boroughs: borough names known up front (more are added by update)
+    """
+
+    def __init__(self, boroughs=()):
+        self.boroughs = []
+        self.cells = {'count': np.zeros((0, 12, 31, 24, 7, 2), dtype=np.int64)}
+        for stat, fill in [('sum', 0.0), ('sumsq', 0.0), ('min', np.inf), ('max', -np.inf)]:
+            self.cells[stat] = np.full((0, 12, 31, 24, 7, 2), fill)
+        self._rollups = {}
+        self.dropped = 0
+        self._borough_order = self._borough_rank = np.zeros(0, dtype=np.intp)
+        self._grow(boroughs)
+
+    @property
+    def labels(self):
+        return {'borough': sorted(self.boroughs), 'start_month': MONTHS, 'start_day': list(range(1, 32)),
+                'start_hour': list(range(24)), 'week_day': WEEKDAYS, 'hday': HDAY}
+
+    def _grow(self, boroughs):
+        new = [name for name in pd.unique(np.asarray(boroughs, dtype=object)) if name not in self.boroughs]
+        if not new:
+            return
+        self.boroughs.extend(new)
+        # boroughs are stored in arrival order but reported sorted
+        self._borough_order = np.argsort(np.asarray(self.boroughs, dtype=object))
+        self._borough_rank = np.argsort(self._borough_order)
+        for stat, values in self.cells.items():
+            fill = {'min': np.inf, 'max': -np.inf}.get(stat, 0)
+            block = np.full((len(new),) + values.shape[1:], fill, dtype=values.dtype)
+            self.cells[stat] = np.concatenate([values, block])
+
+    @staticmethod
+    def _labels(series):
+        # map the few categories, not every row
+        if hasattr(series, 'cat'):
+            return series.cat.categories.to_numpy(dtype=object), series.cat.codes.to_numpy()
+        codes, labels = pd.factorize(series)
+        return np.asarray(labels, dtype=object), codes
+
+    @staticmethod
+    def _part(values, size, name, offset=0):
+        """Codes 0..size-1 of a date part, -1 where it is missing (NaN, or -1 as analysis.features marks it)"""
+        values = np.asarray(values, dtype=np.float64)
+        missing = np.isnan(values) | (values == -1)
+        codes = np.where(missing, -1, values - offset)
+        bad = ~missing & ((codes < 0) | (codes >= size) | (codes != np.floor(codes)))
+        if bad.any():
+            raise ValueError("{} has {} values outside {}..{}, e.g. {}".format(
+                name, bad.sum(), offset, offset + size - 1, values[bad][0]))
+        return codes.astype(np.intp)
+
+    def _codes(self, df):
+        """Cell coordinates of every row, -1 where a key is missing"""
+        names, borough = self._labels(df['borough'])
+        self._grow(names[np.unique(borough[borough >= 0])])
+        flags, hday = self._labels(df['hday'])
+        unknown = set(flags[np.unique(hday[hday >= 0])]) - set(HDAY)
+        if unknown:
+            raise ValueError("hday must be one of {}, got {}".format(HDAY, sorted(unknown)))
+        if hasattr(df['start_month'], 'cat'):
+            month = self._part(df['start_month'].cat.codes, 12, 'start_month')
+        else:
+            month = self._part(df['start_month'], 12, 'start_month', offset=1)
+        if 'dayofweek' in df:
+            weekday = self._part(df['dayofweek'], 7, 'dayofweek')
+        else:
+            weekday = self._part(df['week_day'].cat.codes, 7, 'week_day')
+        borough = np.where(borough >= 0, pd.Index(self.boroughs).get_indexer(names)[borough], -1)
+        return {'borough': borough.astype(np.intp),
+                'start_month': month,
+                'start_day': self._part(df['start_day'], 31, 'start_day', offset=1),
+                'start_hour': self._part(df['start_hour'], 24, 'start_hour'),
+                'week_day': weekday,
+                'hday': np.where(hday >= 0, (flags == 'Y').astype(np.intp)[hday], -1)}
+
+    @staticmethod
+    def _add(cells, flat, pickups):
+        np.add.at(cells['count'].reshape(-1), flat, 1)
+        np.add.at(cells['sum'].reshape(-1), flat, pickups)
+        np.add.at(cells['sumsq'].reshape(-1), flat, pickups * pickups)
+        np.minimum.at(cells['min'].reshape(-1), flat, pickups)
+        np.maximum.at(cells['max'].reshape(-1), flat, pickups)
+
+    @profiled('cube_update')
+    def update(self, df):
+        """
+        Add hourly rows to the cube
+        df: cleaned pickup frame (see analysis.cleaning) with borough,
+            start_month, start_day, start_hour, week_day/dayofweek, hday and pickups
+
+        Roll-ups already asked for are updated with the new rows instead of
+        being recomputed from the cells. Rows with a missing key or missing
+        pickups are counted in dropped; a date part out of range raises
+        ValueError.
+        """
+        if not len(df):
+            return self
+        known = len(self.boroughs)
+        codes = self._codes(df)
+        pickups = df['pickups'].to_numpy(dtype=np.float64)
+        keep = ~np.isnan(pickups)
+        for dim in DIMS:
+            keep &= codes[dim] >= 0
+        if not keep.all():
+            self.dropped += int(len(keep) - keep.sum())
+            codes = {dim: values[keep] for dim, values in codes.items()}
+            pickups = pickups[keep]
+        self._add(self.cells, np.ravel_multi_index([codes[dim] for dim in DIMS], self.cells['count'].shape),
+                  pickups)
+        if len(self.boroughs) != known:
+            self._rollups.clear()
+        for by, rollup in self._rollups.items():
+            axes = [codes[dim] if dim != 'borough' else self._borough_rank[codes[dim]] for dim in by]
+            flat = np.ravel_multi_index(axes, rollup['cells']['count'].shape) if by \
+                else np.zeros(len(pickups), dtype=np.intp)
+            self._add(rollup['cells'], flat, pickups)
+        return self
+
+    def merge(self, other):
+        """Add the cells of another cube (e.g. built by another worker)"""
+        self._grow(other.boroughs)
+        rows = pd.Index(self.boroughs).get_indexer(other.boroughs)
+        self._rollups.clear()
+        self.dropped += other.dropped
+        for stat in ['count', 'sum', 'sumsq']:
+            np.add.at(self.cells[stat], rows, other.cells[stat])
+        np.minimum.at(self.cells['min'], rows, other.cells['min'])
+        np.maximum.at(self.cells['max'], rows, other.cells['max'])
+        return self
+
+    def _reduce(self, by):
+        key = tuple(by)
+        if key not in self._rollups:
+            axes = tuple(i for i, dim in enumerate(DIMS) if dim not in by)
+            reduced = {'count': self.cells['count'].sum(axis=axes),
+                       'sum': self.cells['sum'].sum(axis=axes),
+                       'sumsq': self.cells['sumsq'].sum(axis=axes),
+                       'min': self.cells['min'].min(axis=axes),
+                       'max': self.cells['max'].max(axis=axes)}
+            # the cube keeps its own axis order, move to the order asked for
+            order = sorted(range(len(by)), key=lambda i: DIMS.index(by[i]))
+            perm = [order.index(i) for i in range(len(by))]
+            reduced = {stat: np.ascontiguousarray(values.transpose(perm)) for stat, values in reduced.items()}
+            if 'borough' in by:
+                axis = by.index('borough')
+                reduced = {stat: values.take(self._borough_order, axis=axis) for stat, values in reduced.items()}
+            labels = self.labels
+            index = pd.MultiIndex.from_product([labels[dim] for dim in by], names=by) if by else None
+            if len(by) == 1:
+                index = index.get_level_values(0)
+            self._rollups[key] = {'cells': reduced, 'index': index}
+        return self._rollups[key]
+
+    def rollup(self, by, stat='sum'):
+        """
+        Pickup statistic grouped by some of the cube dimensions
+        by: dimension name or list of names from DIMS
+        stat: count, sum, mean, var, std, min or max (default sum)
+
+        Groups with no rows are left out, like DataFrame.groupby.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        unknown = set(by) - set(DIMS)
+        if unknown:
+            raise ValueError("unknown cube dimensions: {}".format(sorted(unknown)))
+        rollup = self._reduce(by)
+        cells = rollup['cells']
+        count = cells['count']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if stat in ('count', 'sum', 'min', 'max'):
+                values = cells[stat]
+            elif stat == 'mean':
+                values = cells['sum'] / count
+            elif stat in ('var', 'std'):
+                mean = cells['sum'] / count
+                values = (cells['sumsq'] - count * mean * mean) / (count - 1)
+                values = np.maximum(values, 0)
+                if stat == 'std':
+                    values = np.sqrt(values)
+            else:
+                raise ValueError("unknown statistic: {}".format(stat))
+        if not by:
+            return pd.Series([values.item()], index=['pickups'])
+        present = np.flatnonzero(count.reshape(-1))
+        return pd.Series(values.reshape(-1)[present], index=rollup['index'][present], name='pickups')
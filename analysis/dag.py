@@ -0,0 +1,207 @@
+"""
+Memoized DAG of pipeline stages.
+
+The notebook is a linear cell export: any change reruns everything from
+the top, and frames are shared through df = data or copied whole. A
+Pipeline declares each stage with its inputs. A stage's key hashes its
+source code and what it uses from analysis.* (functions it calls,
+classes with all their methods, module constants, as analysis.cache
+does), its parameters and the content digests of its inputs, and its
+output is stored on disk under that key. A rerun therefore executes only
+the stages whose code, parameters or inputs changed. A stage whose
+output comes out byte-identical leaves everything downstream cached.
+
+Stages run in a process pool as soon as their inputs exist, so
+independent stages (the EDA summaries of the cleaned frame) run at the
+same time. Every stage reads its inputs from disk and cannot change
+another stage's frame in place.
+
+Frames are stored as uncompressed Arrow IPC files and memory-mapped on
+load; other outputs are pickled.
+"""
+import hashlib
+import json
+import os
+import pickle
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+from analysis.cache import file_digest, pa, read_frame, steps_digest, write_frame
+
+Stage = namedtuple('Stage', ['name', 'func', 'inputs', 'params'], defaults=[(), None])
+Stage.__doc__ = """
+Step of a pipeline
+name: output name other stages refer to
+func: module-level function called as func(*inputs, **params)
+inputs: names of stage outputs or of sources given to Pipeline.run
+params: keyword arguments, part of the key (default none)
+"""
+
+
+def _store(value, path):
+    """Write an output next to path and return (file, sha256 of its bytes)"""
+    if isinstance(value, pd.DataFrame):
+        path += '.arrow'
+        write_frame(value, path, index=not isinstance(value.index, pd.RangeIndex))
+    else:
+        path += '.pkl'
+        with open(path + '.tmp', 'wb') as handle:
+            pickle.dump(value, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+    return path, file_digest(path)
+
+
+def _load(path):
+    if path.endswith('.arrow'):
+        return read_frame(path)
+    with open(path, 'rb') as handle:
+        return pickle.load(handle)
+
+
+def _execute(task):
+    func, params, inputs, path = task
+    start = time.perf_counter()
+    value = func(*[_load(source) if loaded else source for source, loaded in inputs], **params)
+    output, digest = _store(value, path)
+    return output, digest, time.perf_counter() - start
+
+
+class Pipeline:
+    """
+    Stages with explicit inputs, memoized on disk
+    stages: list of Stage, in any order
+    directory: where outputs and their metadata are kept
+    workers: processes running stages (default os.cpu_count(); 1 runs in
+             this process)
+    """
+
+    def __init__(self, stages, directory, workers=None):
+        if pa is None:
+            raise ImportError("Pipeline needs pyarrow")
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("stage names must be unique")
+        self.directory = directory
+        self.workers = workers or os.cpu_count() or 1
+        self.outputs = {}
+        self.report = pd.DataFrame()
+        os.makedirs(directory, exist_ok=True)
+        self.order = self._toposort()
+
+    def _toposort(self):
+        order, state = [], {}
+
+        def visit(name, path):
+            if state.get(name) == 'done' or name not in self.stages:
+                return
+            if state.get(name) == 'active':
+                raise ValueError("cycle through stages {}".format(' -> '.join(path + [name])))
+            state[name] = 'active'
+            for source in self.stages[name].inputs:
+                visit(source, path + [name])
+            state[name] = 'done'
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    @property
+    def sources(self):
+        """Inputs no stage produces, to be passed to run()"""
+        return sorted({source for stage in self.stages.values() for source in stage.inputs} - set(self.stages))
+
+    def _needed(self, targets):
+        needed, pending = set(), list(targets)
+        while pending:
+            name = pending.pop()
+            if name in self.stages and name not in needed:
+                needed.add(name)
+                pending.extend(self.stages[name].inputs)
+        return needed
+
+    def _key(self, stage, digests):
+        digest = hashlib.sha256(stage.name.encode())
+        digest.update(steps_digest([stage.func]).encode())
+        digest.update(json.dumps(stage.params or {}, sort_keys=True, default=repr).encode())
+        for source in stage.inputs:
+            digest.update(digests[source].encode())
+        return digest.hexdigest()[:32]
+
+    def _cached(self, stage, key):
+        meta = os.path.join(self.directory, '{}-{}.json'.format(stage.name, key))
+        if not os.path.exists(meta):
+            return None
+        with open(meta) as handle:
+            found = json.load(handle)
+        return found if os.path.exists(found['output']) else None
+
+    def run(self, sources=None, targets=None):
+        """
+        Bring the targets up to date
+        sources: {name: value}; a path to an existing file is hashed by
+                 its contents and passed on as the path, any other value
+                 by its repr
+        targets: stage names to produce (default all)
+
+        Returns self; report holds, per stage, whether it ran or was
+        cached, its key and its seconds.
+        """
+        sources = dict(sources or {})
+        missing = set(self.sources) - set(sources)
+        if missing:
+            raise ValueError("missing sources: {}".format(sorted(missing)))
+        needed = self._needed(targets if targets is not None else list(self.stages))
+        digests = {name: file_digest(value) if isinstance(value, str) and os.path.isfile(value)
+                   else hashlib.sha256(repr(value).encode()).hexdigest() for name, value in sources.items()}
+        rows = {}
+        waiting = [name for name in self.order if name in needed]
+        running = {}
+        pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        try:
+            while waiting or running:
+                for name in [n for n in waiting if all(s in digests for s in self.stages[n].inputs)]:
+                    waiting.remove(name)
+                    stage = self.stages[name]
+                    key = self._key(stage, digests)
+                    found = self._cached(stage, key)
+                    if found is not None:
+                        self.outputs[name], digests[name] = found['output'], found['digest']
+                        rows[name] = {'status': 'cached', 'key': key, 'seconds': 0.0}
+                        continue
+                    inputs = [(self.outputs[s], True) if s in self.stages else (sources[s], False)
+                              for s in stage.inputs]
+                    task = (stage.func, stage.params or {}, inputs,
+                            os.path.join(self.directory, '{}-{}'.format(name, key)))
+                    if pool is None:
+                        self._finish(name, key, _execute(task), digests, rows)
+                    else:
+                        running[pool.submit(_execute, task)] = (name, key)
+                if running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name, key = running.pop(future)
+                        self._finish(name, key, future.result(), digests, rows)
+                elif waiting and not any(all(s in digests for s in self.stages[n].inputs) for n in waiting):
+                    raise RuntimeError("stages {} cannot run".format(waiting))
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        self.report = pd.DataFrame.from_dict(rows, orient='index')
+        return self
+
+    def _finish(self, name, key, result, digests, rows):
+        output, digest, seconds = result
+        with open(os.path.join(self.directory, '{}-{}.json'.format(name, key)), 'w') as handle:
+            json.dump({'output': output, 'digest': digest, 'seconds': seconds}, handle)
+        self.outputs[name], digests[name] = output, digest
+        rows[name] = {'status': 'ran', 'key': key, 'seconds': seconds}
+
+    def load(self, name):
+        """Output of a stage from the last run"""
+        if name not in self.outputs:
+            raise KeyError("{} has not been run".format(name))
+        return _load(self.outputs[name])
@@ -0,0 +1,171 @@
+"""
+Fitted one-hot encoder with a fixed column layout.
+
+The car script replaces origin 1/2/3 with strings and calls
+pd.get_dummies every run, so the dummy columns depend on which values
+happen to be present and train, test and scoring frames can disagree.
+CategoricalEncoder learns the categories once, maps values straight to
+integer codes and writes uint8 dense or SciPy sparse one-hot blocks in
+that fixed layout. It round-trips through json, so the scoring path never
+derives categories again.
+
+A feature can also be a tuple of columns, e.g. ('borough', 'start_hour'),
+which encodes their cross product without building combined strings.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from analysis.impute import _python
+
+ORIGIN_LABELS = {1: 'america', 2: 'europe', 3: 'asia'}
+
+
+class CategoricalEncoder:
+    """
+    One-hot encoder over a fixed set of categories
+    features: column names or tuples of column names (crosses)
+    labels: {column: {value: label}} used in output names, e.g.
+            {'origin': ORIGIN_LABELS} gives origin_america like the notebook
+    unknown: 'ignore' leaves an all-zero row for unseen values, 'error'
+             raises (default 'ignore')
+    categories: {column: values} fixed up front instead of learned by fit,
+                e.g. {'origin': [1, 2, 3]}
+    """
+
+    def __init__(self, features, labels=None, unknown='ignore', categories=None):
+        if unknown not in ('ignore', 'error'):
+            raise ValueError("unknown must be 'ignore' or 'error', got {}".format(unknown))
+        self.features = [tuple(f) if isinstance(f, (list, tuple)) else f for f in features]
+        self.labels = labels or {}
+        self.unknown = unknown
+        self.fixed = {col: list(values) for col, values in (categories or {}).items()}
+        self.categories = dict(self.fixed)
+
+    def _columns(self):
+        columns = []
+        for feature in self.features:
+            columns.extend(feature if isinstance(feature, tuple) else [feature])
+        return list(dict.fromkeys(columns))
+
+    def fit(self, df):
+        """Learn the sorted categories of every column not fixed up front"""
+        for col in self._columns():
+            if col in self.fixed:
+                continue
+            values = df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                categories = values.cat.categories
+            else:
+                categories = pd.Index(values.dropna().unique()).sort_values()
+            self.categories[col] = [_python(v) for v in categories]
+        return self
+
+    def _codes(self, df, col):
+        values = df[col]
+        categories = pd.Index(self.categories[col])
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # map the few categories, not every row
+            codes = categories.get_indexer(values.cat.categories)
+            codes = np.where(values.cat.codes.to_numpy() >= 0, codes[values.cat.codes.to_numpy()], -1)
+        else:
+            codes = categories.get_indexer(values.to_numpy())
+        if self.unknown == 'error' and (codes < 0).any():
+            unseen = pd.unique(values.to_numpy()[codes < 0])
+            raise ValueError("unseen values in {}: {}".format(col, list(unseen)[:10]))
+        return codes
+
+    def _label(self, col, value):
+        return self.labels.get(col, {}).get(value, value)
+
+    def _blocks(self, df):
+        """(codes, width) per feature"""
+        codes = {col: self._codes(df, col) for col in self._columns()}
+        blocks = []
+        for feature in self.features:
+            if isinstance(feature, tuple):
+                code = np.zeros(len(df), dtype=np.int64)
+                width = 1
+                missing = np.zeros(len(df), dtype=bool)
+                for col in feature:
+                    code = code * len(self.categories[col]) + codes[col]
+                    width *= len(self.categories[col])
+                    missing |= codes[col] < 0
+                code[missing] = -1
+            else:
+                code = codes[feature]
+                width = len(self.categories[feature])
+            blocks.append((code, width))
+        return blocks
+
+    @property
+    def feature_names(self):
+        names = []
+        for feature in self.features:
+            columns = feature if isinstance(feature, tuple) else (feature,)
+            keys = pd.MultiIndex.from_product([[self._label(c, v) for v in self.categories[c]] for c in columns])
+            names.extend('_'.join(columns) + '_' + '_'.join(str(v) for v in key) for key in keys)
+        return names
+
+    def transform(self, df, sparse=False):
+        """
+        One-hot block of df in the fitted layout
+        df: frame with the encoded columns
+        sparse: return a scipy.sparse.csr_matrix instead of a dense array
+
+        The dense block is uint8, one column per category (per combination
+        for crosses), ordered as feature_names.
+        """
+        if set(self._columns()) - set(self.categories):
+            raise ValueError("CategoricalEncoder is not fitted")
+        blocks = self._blocks(df)
+        n = len(df)
+        width = sum(block[1] for block in blocks)
+        rows, cols = [], []
+        offset = 0
+        for code, size in blocks:
+            present = np.flatnonzero(code >= 0)
+            rows.append(present)
+            cols.append(code[present] + offset)
+            offset += size
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        if sparse:
+            from scipy import sparse as sp
+            return sp.csr_matrix((np.ones(len(rows), dtype=np.uint8), (rows, cols)), shape=(n, width))
+        out = np.zeros((n, width), dtype=np.uint8)
+        out[rows, cols] = 1
+        return out
+
+    def transform_frame(self, df):
+        """
+        df with the encoded columns replaced by uint8 dummies, as
+        pd.get_dummies(df, columns=...) but always with the same columns
+        """
+        dummies = pd.DataFrame(self.transform(df), columns=self.feature_names, index=df.index)
+        return pd.concat([df.drop(columns=self._columns()), dummies], axis=1)
+
+    def fit_transform(self, df, sparse=False):
+        return self.fit(df).transform(df, sparse=sparse)
+
+    def to_dict(self):
+        return {'features': [list(f) if isinstance(f, tuple) else f for f in self.features],
+                'labels': {col: [[k, v] for k, v in mapping.items()] for col, mapping in self.labels.items()},
+                'unknown': self.unknown, 'categories': self.categories}
+
+    @classmethod
+    def from_dict(cls, state):
+        labels = {col: {k: v for k, v in pairs} for col, pairs in state['labels'].items()}
+        encoder = cls(state['features'], labels=labels, unknown=state['unknown'])
+        encoder.categories = {col: list(values) for col, values in state['categories'].items()}
+        return encoder
+
+    def save(self, path):
+        """Write the fitted encoder to a json file"""
+        with open(path, 'w') as handle:
+            json.dump(self.to_dict(), handle)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as handle:
+            return cls.from_dict(json.load(handle))
@@ -0,0 +1,108 @@
+"""
+Date-part extraction with a single decode of the timestamps.
+
+The notebook calls five .dt accessors, two of which build python string
+columns (month_name, day_name) that later get turned back into ordered
+categoricals for plotting. extract_date_parts reads the int64 timestamps
+once and derives every part with integer arithmetic (Howard Hinnant's
+days-to-civil algorithm, run once per distinct calendar day), emitting
+int8/int16 codes and ordered categoricals directly.
+"""
+import numpy as np
+import pandas as pd
+
+from analysis.loader import DATETIME_COLUMN
+from analysis.profiling import profiled
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+MONTH_DTYPE = pd.CategoricalDtype(MONTHS, ordered=True)
+WEEKDAY_DTYPE = pd.CategoricalDtype(WEEKDAYS, ordered=True)
+
+_DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.int8)
+_PER_SECOND = {'s': 1, 'ms': 10 ** 3, 'us': 10 ** 6, 'ns': 10 ** 9}
+
+
+def _minutes(stamps):
+    values = np.asarray(stamps)
+    if values.dtype.kind != 'M':
+        raise TypeError("expected a datetime64 column, got {}".format(values.dtype))
+    unit = np.datetime_data(values.dtype)[0]
+    if unit not in _PER_SECOND:
+        values = values.astype('datetime64[s]')
+        unit = 's'
+    raw = values.view(np.int64)
+    return raw // (60 * _PER_SECOND[unit]), np.isnat(values)
+
+
+def _civil(days):
+    z = days + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = np.where(mp < 10, mp + 3, mp - 9)
+    year = yoe + era * 400 + (month <= 2)
+
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    daysinmonth = _DAYS_IN_MONTH[month - 1] + ((month == 2) & leap)
+    return {'start_year': year.astype(np.int16),
+            'month': (month - 1).astype(np.int8),
+            'start_day': day.astype(np.int8),
+            'dayofweek': ((days + 3) % 7).astype(np.int8),  # 1970-01-01 was a Thursday
+            'daysinmonth': daysinmonth.astype(np.int8)}
+
+
+def date_parts(stamps):
+    """
+    Decode datetime64 values into a dict of date-part arrays
+    stamps: datetime64 series or array (timezone naive)
+
+    NaT rows get -1 in the integer parts and NaN in the categoricals.
+    """
+    minutes, missing = _minutes(stamps)
+    if missing.any():
+        minutes[missing] = 0 if missing.all() else minutes[~missing].min()
+    days = minutes // 1440
+    hour = ((minutes - days * 1440) // 60).astype(np.int8)
+
+    # the data spans few distinct days, so decode each calendar day once
+    # and look the rows up in the table
+    first, last = (days.min(), days.max()) if len(days) else (0, 0)
+    if last - first < len(days):
+        days -= first
+        parts = {name: table[days] for name, table in _civil(np.arange(first, last + 1)).items()}
+    else:
+        parts = _civil(days)
+    parts['start_hour'] = hour
+    if missing.any():
+        for values in parts.values():
+            values[missing] = -1
+    return parts
+
+
+@profiled('date_parts')
+def extract_date_parts(df, column=DATETIME_COLUMN, drop=False):
+    """
+    Add start_year, start_month, start_hour, start_day, week_day,
+    daysinmonth and dayofweek columns from one datetime column
+    df: dataframe, changed in place
+    column: datetime column (default pickup_dt)
+    drop: drop the datetime column afterwards (default False)
+    """
+    parts = date_parts(df[column])
+    month = parts.pop('month')
+    df['start_year'] = parts['start_year']
+    df['start_month'] = pd.Categorical.from_codes(month, dtype=MONTH_DTYPE)
+    df['start_hour'] = parts['start_hour']
+    df['start_day'] = parts['start_day']
+    df['week_day'] = pd.Categorical.from_codes(parts['dayofweek'], dtype=WEEKDAY_DTYPE)
+    df['daysinmonth'] = parts['daysinmonth']
+    df['dayofweek'] = parts['dayofweek']
+    if drop:
+        df.drop(column, axis=1, inplace=True)
+    return df
@@ -0,0 +1,213 @@
+"""
+Content-addressed cache of rendered figures.
+
+Every report run redraws the same hourly, weekday and borough charts
+even when neither the data nor the arguments changed. FigureCache keys
+an image by a hash of
+
+- the plotting function's source (and the analysis.* helpers it calls),
+- the data it is drawn from (row hashes of frames, bytes of arrays),
+- its keyword arguments, the image format and dpi,
+- the matplotlib, seaborn, pandas and numpy versions and the rcParams,
+
+and hands back the stored file instead of drawing again. Files live in
+one directory under a disk budget; the least recently used are evicted
+first (a hit touches the file's mtime).
+
+    cache = FigureCache('.figures', budget=200 * 2 ** 20)
+    path = cache.figure(histogram_boxplot, df, feature='pickups')
+    path = cache.figure(sns.lineplot, hourly, x='start_hour', y='pickups')
+    cache.stats()
+"""
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from analysis.cache import steps_digest
+
+BUDGET = 256 * 2 ** 20
+
+
+def _update(digest, value):
+    """Feed a value into digest by content"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest.update(repr((type(value).__name__, value.shape, getattr(value, 'name', None))).encode())
+        digest.update(repr(value.dtypes.to_dict() if isinstance(value, pd.DataFrame) else value.dtype).encode())
+        digest.update(repr(list(value.columns) if isinstance(value, pd.DataFrame) else None).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(repr((value.dtype.str, value.shape)).encode())
+        digest.update(np.ascontiguousarray(value).tobytes() if value.dtype != object else pickle.dumps(value))
+    elif isinstance(value, dict):
+        digest.update(b'{')
+        for key in sorted(value, key=repr):
+            _update(digest, key)
+            _update(digest, value[key])
+        digest.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        digest.update(b'[' if isinstance(value, list) else b'(')
+        for item in value:
+            _update(digest, item)
+        digest.update(b']')
+    elif value is None or isinstance(value, (str, bytes, int, float, bool, np.generic)):
+        digest.update(repr(value).encode())
+    elif callable(value):
+        digest.update(function_digest(value).encode())
+    else:
+        digest.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def data_digest(*values):
+    """sha256 of values by content"""
+    digest = hashlib.sha256()
+    for value in values:
+        _update(digest, value)
+    return digest.hexdigest()
+
+
+def function_digest(func):
+    """Source hash of func, its module and name when the source is not available"""
+    try:
+        return steps_digest([func])
+    except (TypeError, OSError):
+        return '{}.{}'.format(getattr(func, '__module__', ''), getattr(func, '__qualname__', repr(func)))
+
+
+def environment_digest():
+    """Library versions and rcParams that change how a figure renders"""
+    import matplotlib
+    import seaborn
+    rc = sorted((key, repr(value)) for key, value in matplotlib.rcParams.items())
+    return data_digest([matplotlib.__version__, seaborn.__version__, pd.__version__, np.__version__, rc])
+
+
+def _as_figure(drawn):
+    """The figure behind what a plotting call returned (Figure, Axes, seaborn grid, (figure, ...))"""
+    from matplotlib.figure import Figure
+    if isinstance(drawn, tuple):
+        drawn = drawn[0]
+    if isinstance(drawn, Figure):
+        return drawn
+    figure = getattr(drawn, 'figure', None)
+    if figure is None:
+        raise TypeError("cannot find the figure of {}".format(type(drawn).__name__))
+    return figure
+
+
+class FigureCache:
+    """
+    Rendered figures keyed by content, least recently used evicted first
+    directory: where the images are kept
+    budget: maximum bytes of images kept (default 256 MB)
+    """
+
+    def __init__(self, directory, budget=BUDGET):
+        self.directory = directory
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._environment = None
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, func, data, fmt='png', dpi=100, **kwargs):
+        """Cache key of func(data, **kwargs) saved as fmt at dpi"""
+        if self._environment is None:
+            self._environment = environment_digest()
+        return data_digest(function_digest(func), data, kwargs, fmt, dpi, self._environment)[:40]
+
+    def path(self, key, fmt):
+        return os.path.join(self.directory, '{}.{}'.format(key, fmt))
+
+    def get(self, key, fmt):
+        """Path of the stored image, or None; counts a hit or a miss"""
+        path = self.path(key, fmt)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def put(self, key, fmt, source):
+        """Copy an image file into the cache and evict down to the budget"""
+        path = self.path(key, fmt)
+        handle, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(handle)
+        try:
+            shutil.copyfile(source, tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict(keep=path)
+        return path
+
+    def entries(self):
+        """Stored images, least recently used first: (path, bytes, mtime)"""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self, keep=None):
+        """Remove least recently used images until the total fits the budget"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.budget:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
+            self.evictions += 1
+        return total
+
+    def figure(self, func, data, fmt='png', dpi=100, **kwargs):
+        """
+        Path of the image of func(data, **kwargs), drawn only on a miss
+        func: plotting function, called as func(data, **kwargs), or as
+              func(data=data, **kwargs) for seaborn functions
+        data: frame, array or dict of them the figure is drawn from
+        fmt, dpi: image format and resolution
+        kwargs: plotting arguments, part of the key
+        """
+        key = self.key(func, data, fmt, dpi, **kwargs)
+        path = self.get(key, fmt)
+        if path is not None:
+            return path
+        import matplotlib.pyplot as plt
+        data_keyword = getattr(func, '__module__', '').startswith('seaborn')
+        # axes-level functions draw on the current figure, give them a fresh one
+        blank = plt.figure()
+        drawn = func(data=data, **kwargs) if data_keyword else func(data, **kwargs)
+        figure = _as_figure(drawn)
+        if figure is not blank:
+            plt.close(blank)
+        handle, tmp = tempfile.mkstemp(dir=self.directory, suffix='.{}.tmp'.format(fmt))
+        os.close(handle)
+        try:
+            figure.savefig(tmp, format=fmt, dpi=dpi, bbox_inches='tight')
+            path = self.put(key, fmt, tmp)
+        finally:
+            os.remove(tmp)
+            plt.close(figure)
+        return path
+
+    def stats(self):
+        """Hits, misses, hit rate, evictions, stored images and bytes"""
+        entries = self.entries()
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else np.nan,
+                'evictions': self.evictions, 'images': len(entries), 'bytes': sum(size for _, size, _ in entries),
+                'budget': self.budget}
@@ -0,0 +1,287 @@
+"""
+Hourly pickup forecasts per borough.
+
+Recommendation 5 of the case study asks for a model that predicts
+pickups per hour for fleet planning. PickupForecaster is a linear model
+of pickups on one-hot calendar features (hour, weekday, month, holiday)
+and the weather columns, fitted either per borough or pooled over all
+boroughs with a borough effect.
+
+Rows are added with update() into OLSAccumulators, so refitting after
+new hours arrive only adds their Gram matrix, and forecast() scores the
+next 24 hours of every borough with one batched product: all boroughs
+share the design layout and each row picks its borough's coefficients.
+
+Each one-hot block next to the intercept would be collinear with it, so
+every model is fitted on the regressors its rows identify: constant
+columns (levels never seen, weather that never changed) are left out and
+the first remaining level of each block is the reference. Left-out
+levels get the reference's effect, a coefficient of 0.
+
+Boroughs first seen after the first frame are added as they arrive, as
+analysis.loader grows the borough categories chunk by chunk: they get
+their own model, or in the pooled model a borough column that was 0 on
+every earlier row, and fit() has to be called again.
+
+backtest() replays a frame over rolling origins, growing the training
+window up to each origin and scoring the hours after it.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis.cube import HDAY
+from analysis.encoding import CategoricalEncoder
+from analysis.features import MONTHS, WEEKDAYS, extract_date_parts
+from analysis.loader import DATETIME_COLUMN, WEATHER_COLUMNS
+from analysis.metrics import RegressionMetrics
+from analysis.ols import OLSAccumulator
+
+CALENDAR = ['start_hour', 'week_day', 'start_month', 'hday']
+HORIZON = 24
+TARGET = 'pickups'
+
+_CATEGORIES = {'start_hour': list(range(24)), 'week_day': WEEKDAYS, 'start_month': MONTHS, 'hday': HDAY}
+
+
+class PickupForecaster:
+    """
+    Linear model of hourly pickups
+    pooled: one model over all boroughs with a borough effect instead of
+            one model per borough (default False)
+    categorical: one-hot encoded calendar features, crosses allowed, e.g.
+                 [('week_day', 'start_hour'), 'start_month', 'hday']
+                 (default CALENDAR)
+    numeric: columns used as they are (default WEATHER_COLUMNS)
+    boroughs: borough names in model order (default the categories of the
+              first frame); boroughs first seen later are appended
+    """
+
+    def __init__(self, pooled=False, categorical=CALENDAR, numeric=WEATHER_COLUMNS, boroughs=None):
+        self.pooled = pooled
+        self.categorical = list(categorical)
+        self.numeric = list(numeric)
+        self.boroughs = list(boroughs) if boroughs is not None else None
+        self.encoder = None
+        self.accumulators = {}
+        self.results = {}
+        self.last_time = None
+        self.last_weather = {}
+        self.holidays = set()
+        self.skipped = 0
+
+    def _setup(self, df):
+        if self.boroughs is None:
+            borough = df['borough']
+            self.boroughs = list(borough.cat.categories) if isinstance(borough.dtype, pd.CategoricalDtype) \
+                else sorted(borough.dropna().unique())
+        features = self.categorical + (['borough'] if self.pooled else [])
+        categories = dict(_CATEGORIES, borough=self.boroughs)
+        self.encoder = CategoricalEncoder(features, categories=categories)
+
+    def _grow(self, df):
+        """Append the boroughs of df not seen before, widening the pooled design"""
+        borough = df['borough']
+        values = borough.cat.categories if isinstance(borough.dtype, pd.CategoricalDtype) \
+            else pd.unique(borough.dropna())
+        known = set(self.boroughs)
+        new = [value for value in values if value not in known]
+        if not new:
+            return
+        self.boroughs.extend(new)
+        self.encoder.fixed['borough'] = self.encoder.categories['borough'] = list(self.boroughs)
+        self.accumulators = {key: acc.reindex(self.names) for key, acc in self.accumulators.items()}
+        # the fitted weights no longer match the boroughs or the design
+        self.results = {}
+
+    @property
+    def names(self):
+        """Regressors of the design matrix, in column order"""
+        return self.numeric + self.encoder.feature_names
+
+    def _frame(self, df):
+        """Calendar parts of pickup_dt next to borough, hday and the numeric columns"""
+        frame = extract_date_parts(pd.DataFrame({DATETIME_COLUMN: df[DATETIME_COLUMN].to_numpy()}))
+        for col in ['borough', 'hday'] + self.numeric:
+            frame[col] = df[col].to_numpy()
+        return frame
+
+    def design(self, df):
+        """Design matrix of df (float64, one row per row of df, columns as names)"""
+        if self.encoder is None:
+            self._setup(df)
+        frame = self._frame(df)
+        return np.hstack([frame[self.numeric].to_numpy(dtype=np.float64), self.encoder.transform(frame)])
+
+    def _borough_index(self, df):
+        return pd.Index(self.boroughs).get_indexer(np.asarray(df['borough'], dtype=object))
+
+    def update(self, df):
+        """
+        Add hourly rows
+        df: pickup frame with pickup_dt, borough, hday, pickups and the
+            numeric columns; rows missing any of them are skipped
+        A borough not seen before is added, and the model must be fitted again.
+        """
+        if not len(df):
+            return self
+        if self.encoder is None:
+            self._setup(df)
+        self._grow(df)
+        x = self.design(df)
+        y = df[TARGET].to_numpy(dtype=np.float64)
+        borough = self._borough_index(df)
+        valid = (borough >= 0) & ~np.isnan(y) & ~np.isnan(x).any(axis=1)
+        self.skipped += int((~valid).sum())
+        x, y, borough = x[valid], y[valid], borough[valid]
+        if self.pooled:
+            self.accumulators.setdefault(None, OLSAccumulator(self.names)).update(x, y)
+        else:
+            order = np.argsort(borough, kind='stable')
+            bounds = np.searchsorted(borough[order], np.arange(len(self.boroughs) + 1))
+            for b in range(len(self.boroughs)):
+                rows = order[bounds[b]:bounds[b + 1]]
+                if len(rows):
+                    self.accumulators.setdefault(b, OLSAccumulator(self.names)).update(x[rows], y[rows])
+        self._remember(df[valid])
+        return self
+
+    def _remember(self, df):
+        """Latest weather per borough and the holiday dates, for forecast()"""
+        if not len(df):
+            return
+        stamps = df[DATETIME_COLUMN]
+        latest = stamps.max()
+        if self.last_time is None or latest >= self.last_time:
+            self.last_time = latest
+        recent = df.sort_values(DATETIME_COLUMN, kind='stable').drop_duplicates('borough', keep='last')
+        for row in recent.itertuples(index=False):
+            borough, stamp = getattr(row, 'borough'), getattr(row, DATETIME_COLUMN)
+            if borough not in self.last_weather or stamp >= self.last_weather[borough][0]:
+                self.last_weather[borough] = (stamp, [getattr(row, col) for col in self.numeric])
+        self.holidays.update(stamps[np.asarray(df['hday']) == 'Y'].dt.normalize())
+
+    def _blocks(self):
+        """Regressor names grouped into numeric columns and one-hot blocks"""
+        blocks = [[name] for name in self.numeric]
+        names = self.encoder.feature_names
+        offset = 0
+        for feature in self.encoder.features:
+            columns = feature if isinstance(feature, tuple) else (feature,)
+            width = int(np.prod([len(self.encoder.categories[col]) for col in columns]))
+            blocks.append(names[offset:offset + width])
+            offset += width
+        return blocks
+
+    def identified(self, accumulator):
+        """
+        Regressors one model's rows identify: the non-constant columns,
+        less the first (reference) level of every one-hot block
+        """
+        # diagonal of the shifted Gram matrix: sum of squares about the first batch's mean
+        spread = dict(zip(accumulator.names, np.diag(accumulator.gram)[1:-1]))
+        tolerance = 1e-9 * accumulator.gram[0, 0]
+        names = []
+        for block in self._blocks():
+            varying = [name for name in block if spread[name] > tolerance]
+            names.extend(varying if len(block) == 1 else varying[1:])
+        return names
+
+    def fit(self):
+        """Solve every model from the rows added so far"""
+        if not self.accumulators:
+            raise ValueError("no rows added")
+        self.results = {key: acc.fit(self.identified(acc)) for key, acc in self.accumulators.items()}
+        self._weights = np.full((len(self.boroughs), len(self.names)), np.nan)
+        self._intercepts = np.full(len(self.boroughs), np.nan)
+        for key, result in self.results.items():
+            rows = slice(None) if key is None else key
+            self._weights[rows] = result.coef.reindex(self.names, fill_value=0.0).to_numpy()
+            self._intercepts[rows] = result.intercept
+        return self
+
+    def predict(self, df):
+        """Pickups predicted for every row of df, NaN for boroughs without a model"""
+        if not self.results:
+            raise ValueError("PickupForecaster is not fitted")
+        x = self.design(df)
+        borough = self._borough_index(df)
+        known = borough >= 0
+        predictions = np.full(len(df), np.nan)
+        b = borough[known]
+        predictions[known] = np.einsum('ij,ij->i', x[known], self._weights[b]) + self._intercepts[b]
+        # a count cannot be negative
+        return np.maximum(predictions, 0.0)
+
+    def future(self, origin=None, hours=HORIZON, weather=None, holidays=None):
+        """
+        Frame of the hours after origin for every borough with a model
+        origin: last known hour (default the latest hour added)
+        hours: horizon (default 24)
+        weather: frame with pickup_dt, borough and the numeric columns for
+                 those hours (default each borough's latest observation)
+        holidays: dates with hday 'Y' (default those seen in update)
+        """
+        origin = pd.Timestamp(origin if origin is not None else self.last_time)
+        stamps = origin + pd.to_timedelta(np.arange(1, hours + 1), unit='h')
+        boroughs = [self.boroughs[b] for b in range(len(self.boroughs))
+                    if (None if self.pooled else b) in self.accumulators]
+        frame = pd.DataFrame({DATETIME_COLUMN: np.tile(stamps, len(boroughs)),
+                              'borough': np.repeat(boroughs, hours)})
+        holidays = pd.DatetimeIndex(sorted(holidays if holidays is not None else self.holidays)).normalize()
+        frame['hday'] = np.where(frame[DATETIME_COLUMN].dt.normalize().isin(holidays), 'Y', 'N')
+        if weather is not None:
+            frame = frame.merge(weather[[DATETIME_COLUMN, 'borough'] + self.numeric], how='left',
+                                on=[DATETIME_COLUMN, 'borough'])
+        else:
+            latest = np.array([self.last_weather.get(b, (None, [np.nan] * len(self.numeric)))[1]
+                               for b in boroughs], dtype=np.float64).reshape(len(boroughs), -1)
+            frame[self.numeric] = np.repeat(latest, hours, axis=0)
+        return frame
+
+    def forecast(self, origin=None, hours=HORIZON, weather=None, holidays=None):
+        """future() with a forecast column, all boroughs scored in one call"""
+        frame = self.future(origin, hours, weather, holidays)
+        frame['forecast'] = self.predict(frame)
+        return frame
+
+
+def backtest(df, origins, horizon=HORIZON, **kwargs):
+    """
+    Rolling-origin evaluation
+    df: pickup frame covering the whole period
+    origins: timestamps; at each, the model is trained on every row up to
+             and including it and scored on the horizon hours after it
+    horizon: hours scored after each origin (default 24)
+    kwargs: passed to PickupForecaster (pooled, categorical, ...)
+
+    The scored hours use their observed weather and holiday flags, i.e. a
+    perfect weather forecast. The training window grows by adding only
+    the rows since the previous origin.
+
+    Returns one row per origin with the row counts, train and predict
+    seconds and the accuracy of the forecasts.
+    """
+    model = PickupForecaster(**kwargs)
+    df = df.sort_values(DATETIME_COLUMN, kind='stable')
+    stamps = df[DATETIME_COLUMN].to_numpy()
+    start = 0
+    rows = []
+    for origin in sorted(pd.Timestamp(o) for o in origins):
+        end = np.searchsorted(stamps, origin.to_datetime64(), side='right')
+        stop = np.searchsorted(stamps, (origin + pd.Timedelta(hours=horizon)).to_datetime64(), side='right')
+        began = time.perf_counter()
+        model.update(df.iloc[start:end]).fit()
+        trained = time.perf_counter()
+        test = df.iloc[end:stop]
+        predictions = model.predict(test)
+        predicted = time.perf_counter()
+        features = max(len(result.coef) for result in model.results.values())
+        metrics = RegressionMetrics(features).update(test[TARGET], predictions)
+        rows.append({'origin': origin, 'train_rows': sum(acc.nobs for acc in model.accumulators.values()),
+                     'test_rows': metrics.n, 'train_s': trained - began, 'predict_s': predicted - trained,
+                     'mse': metrics.mse, 'rmse': metrics.rmse, 'mae': metrics.mae,
+                     'rsquared': metrics.rsquared})
+        start = end
+    return pd.DataFrame(rows)
@@ -0,0 +1,157 @@
+"""
+Missing-value imputation from a per-column spec.
+
+The Uber notebook fills temp with the Brooklyn mean and borough with
+'Unknown' in separate cells, and the car script fills every column with
+its median through apply(..., axis=0). Imputer takes one spec for all
+columns, computes every statistic it needs with one aggregation per set
+of group keys, fills the frame in place and can be saved so new batches
+are filled with the same statistics.
+
+A spec maps a column to a strategy name ('mean', 'median') or to a dict:
+
+    {'strategy': 'constant', 'value': 'Unknown'}
+    {'strategy': 'mean', 'by': ['borough', 'start_month']}
+    {'strategy': 'mean', 'where': {'borough': 'Brooklyn'}}
+
+'by' fills each row with the statistic of its group; groups not seen when
+fitting (or with no values) fall back to the statistic over all rows.
+'where' computes the statistic on the matching rows only.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from analysis.profiling import profiled
+
+STRATEGIES = ['constant', 'mean', 'median']
+
+# the fills done by uber_case_study.py
+PICKUP_SPEC = {'borough': {'strategy': 'constant', 'value': 'Unknown'},
+               'temp': {'strategy': 'mean', 'where': {'borough': 'Brooklyn'}}}
+
+
+def _normalize(spec):
+    rules = {}
+    for col, rule in spec.items():
+        rule = {'strategy': rule} if isinstance(rule, str) else dict(rule)
+        if rule.get('strategy') not in STRATEGIES:
+            raise ValueError("unknown strategy for {}: {}".format(col, rule.get('strategy')))
+        if rule['strategy'] == 'constant' and 'value' not in rule:
+            raise ValueError("constant strategy for {} needs a value".format(col))
+        rule['by'] = list(rule.get('by') or [])
+        rule['where'] = dict(rule.get('where') or {})
+        rules[col] = rule
+    return rules
+
+
+def _python(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class Imputer:
+    """
+    Fill missing values with constants or (group-wise) statistics
+    spec: {column: strategy or rule dict}, see the module docstring
+    """
+
+    def __init__(self, spec):
+        self.rules = _normalize(spec)
+        self.fills = {}
+        self.groups = {}
+
+    @profiled('impute_fit')
+    def fit(self, df):
+        """Compute every statistic the spec needs"""
+        self.fills, self.groups = {}, {}
+        # one aggregation per (where, by) combination, covering all its columns
+        batches = {}
+        for col, rule in self.rules.items():
+            if rule['strategy'] == 'constant':
+                self.fills[col] = rule['value']
+                continue
+            where = tuple(sorted(rule['where'].items()))
+            batches.setdefault((where, ()), {}).setdefault(col, set()).add(rule['strategy'])
+            if rule['by']:
+                batches.setdefault((where, tuple(rule['by'])), {}).setdefault(col, set()).add(rule['strategy'])
+        for (where, by), stats in batches.items():
+            rows = df
+            if where:
+                mask = np.logical_and.reduce([df[key] == value for key, value in where])
+                rows = df[mask]
+            aggs = {col: sorted(funcs) for col, funcs in stats.items()}
+            if by:
+                result = rows.groupby(list(by), observed=True).agg(aggs)
+                for col, rule in self.rules.items():
+                    if col in aggs and tuple(rule['by']) == by and tuple(sorted(rule['where'].items())) == where:
+                        self.groups[col] = result[(col, rule['strategy'])].dropna()
+            else:
+                result = rows.agg(aggs)
+                for col, rule in self.rules.items():
+                    if col in aggs and tuple(sorted(rule['where'].items())) == where:
+                        self.fills[col] = _python(result.loc[rule['strategy'], col])
+        return self
+
+    @profiled('impute_transform')
+    def transform(self, df):
+        """Fill the missing values of df in place and return it"""
+        if not self.fills and self.rules:
+            raise ValueError("Imputer is not fitted")
+        for col, rule in self.rules.items():
+            if col not in df:
+                continue
+            missing = df[col].isna().to_numpy()
+            if not missing.any():
+                continue
+            values = np.full(missing.sum(), self.fills[col], dtype=object)
+            if col in self.groups:
+                by = rule['by']
+                keys = df.loc[missing, by]
+                keys = pd.MultiIndex.from_frame(keys) if len(by) > 1 else pd.Index(keys[by[0]])
+                grouped = self.groups[col].reindex(keys).to_numpy(dtype=object)
+                found = ~pd.isna(grouped)
+                values[found] = grouped[found]
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                new = pd.Index(pd.unique(values)).difference(df[col].cat.categories)
+                if len(new):
+                    df[col] = df[col].cat.add_categories(new)
+            else:
+                values = values.astype(df[col].dtype) if df[col].dtype.kind in 'fc' else values
+            df.loc[missing, col] = values
+        return df
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+    def to_dict(self):
+        """Spec and fitted statistics as plain python objects"""
+        groups = {col: [list(key) if isinstance(key, tuple) else [key] for key in stat.index] for col, stat
+                  in self.groups.items()}
+        return {'rules': self.rules,
+                'fills': {col: _python(value) for col, value in self.fills.items()},
+                'groups': {col: {'keys': [[_python(k) for k in key] for key in groups[col]],
+                                 'values': [_python(v) for v in stat.to_numpy()]}
+                           for col, stat in self.groups.items()}}
+
+    @classmethod
+    def from_dict(cls, state):
+        imputer = cls(state['rules'])
+        imputer.fills = dict(state['fills'])
+        for col, group in state['groups'].items():
+            by = imputer.rules[col]['by']
+            keys = [tuple(key) for key in group['keys']]
+            index = pd.MultiIndex.from_tuples(keys, names=by) if len(by) > 1 \
+                else pd.Index([key[0] for key in keys], name=by[0])
+            imputer.groups[col] = pd.Series(group['values'], index=index, dtype=float)
+        return imputer
+
+    def save(self, path):
+        """Write the fitted imputer to a json file"""
+        with open(path, 'w') as handle:
+            json.dump(self.to_dict(), handle)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as handle:
+            return cls.from_dict(json.load(handle))
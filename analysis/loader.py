@@ -0,0 +1,86 @@
+"""
+Typed, chunked reader for the Uber pickup csv.
+
+The notebook reads the whole file with pd.read_csv and no dtypes, so
+pickup_dt stays an object column and borough/hday are python strings.
+read_pickups reads the file in bounded chunks with an explicit schema and
+yields frames that are ready to use.
+"""
+import pandas as pd
+
+from analysis.profiling import profiled, stage
+
+DATETIME_COLUMN = 'pickup_dt'
+DATETIME_FORMAT = "%d-%m-%Y %H:%M"
+
+CATEGORY_COLUMNS = ['borough', 'hday']
+WEATHER_COLUMNS = ['spd', 'vsb', 'temp', 'dewp', 'slp', 'pcp01', 'pcp06', 'pcp24', 'sd']
+COLUMNS = ['pickup_dt', 'borough', 'pickups'] + WEATHER_COLUMNS + ['hday']
+
+DTYPES = {'borough': 'category', 'hday': 'category', 'pickups': 'int32'}
+DTYPES.update({col: 'float32' for col in WEATHER_COLUMNS})
+
+CHUNKSIZE = 100_000
+
+
+def _parse_chunk(chunk):
+    if DATETIME_COLUMN in chunk:
+        with stage('datetime_parse', rows=len(chunk)):
+            chunk[DATETIME_COLUMN] = pd.to_datetime(chunk[DATETIME_COLUMN], format=DATETIME_FORMAT)
+    return chunk
+
+
+def read_pickups(path, chunksize=CHUNKSIZE, usecols=None):
+    """
+    Yield the pickup file as typed dataframes of at most chunksize rows
+    path: csv file (or anything pd.read_csv accepts)
+    chunksize: maximum number of rows per yielded frame
+    usecols: subset of COLUMNS to read (default all)
+
+    Categories only ever grow from one chunk to the next, so a later chunk
+    can always be compared with an earlier one.
+    """
+    usecols = list(usecols) if usecols is not None else None
+    dtypes = {col: dtype for col, dtype in DTYPES.items() if usecols is None or col in usecols}
+    dtypes[DATETIME_COLUMN] = 'str'
+    known = {col: pd.Index([]) for col in CATEGORY_COLUMNS if col in dtypes}
+    reader = pd.read_csv(path, dtype=dtypes, usecols=usecols, chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            for col, categories in known.items():
+                categories = categories.append(chunk[col].cat.categories.difference(categories))
+                chunk[col] = chunk[col].cat.set_categories(categories)
+                known[col] = categories
+            yield _parse_chunk(chunk)
+
+
+def align_categories(frames):
+    """
+    Give every categorical column the same categories in all frames
+    frames: list of dataframes, changed in place
+    """
+    for col in CATEGORY_COLUMNS:
+        present = [frame[col] for frame in frames if col in frame]
+        if not present:
+            continue
+        categories = present[0].cat.categories
+        for series in present[1:]:
+            categories = categories.append(series.cat.categories.difference(categories))
+        for frame in frames:
+            if col in frame:
+                frame[col] = frame[col].cat.set_categories(categories)
+    return frames
+
+
+@profiled('load')
+def load_pickups(path, chunksize=CHUNKSIZE, usecols=None):
+    """
+    Read the whole pickup file into one typed dataframe
+    path: csv file
+    chunksize: rows per chunk while reading (default CHUNKSIZE)
+    usecols: subset of COLUMNS to read (default all)
+    """
+    frames = align_categories(list(read_pickups(path, chunksize=chunksize, usecols=usecols)))
+    if not frames:
+        return pd.DataFrame(columns=usecols or COLUMNS)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,152 @@
+"""
+Single-pass, mergeable regression metrics.
+
+The car script computes
+    mse = np.mean((regression_model.predict(x_test)-y_test**2))
+which squares y_test instead of the residual, and gets R^2 from a second
+score() call that predicts again. RegressionMetrics takes (y_true, y_pred)
+batches and keeps the running sums behind MSE, RMSE, MAE, R^2 and
+adjusted R^2, plus a KLLSketch of the residuals for their quantiles, so a
+test set is evaluated chunk by chunk without keeping its predictions.
+Accumulators from several workers merge.
+
+Sums of y are kept about a fixed shift (the first batch's mean) so the
+total sum of squares does not cancel for targets with a large offset.
+"""
+import copy
+
+import numpy as np
+import pandas as pd
+
+from analysis.sketch import DEFAULT_K, KLLSketch
+
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+class RegressionMetrics:
+    """
+    Streaming error metrics of a regression
+    features: number of regressors, for adjusted R^2 (default unknown)
+    k: accuracy parameter of the residual sketch (default 200)
+    seed: seed of the sketch's compaction coins (default random)
+    """
+
+    def __init__(self, features=None, k=DEFAULT_K, seed=None):
+        self.features = features
+        self.n = 0
+        self.shift = None
+        self.sy = 0.0
+        self.syy = 0.0
+        self.sse = 0.0
+        self.sae = 0.0
+        self.residual_sum = 0.0
+        self.residuals = KLLSketch(k, seed)
+
+    def update(self, y_true, y_pred):
+        """
+        Add a batch
+        y_true: observed values
+        y_pred: predictions for the same rows
+        Pairs with a missing value on either side are skipped.
+        """
+        y_true = np.asarray(y_true, dtype=np.float64).ravel()
+        y_pred = np.asarray(y_pred, dtype=np.float64).ravel()
+        if len(y_true) != len(y_pred):
+            raise ValueError("{} observations but {} predictions".format(len(y_true), len(y_pred)))
+        valid = ~(np.isnan(y_true) | np.isnan(y_pred))
+        y_true, y_pred = y_true[valid], y_pred[valid]
+        if not len(y_true):
+            return self
+        if self.shift is None:
+            self.shift = y_true.mean()
+        centered = y_true - self.shift
+        residual = y_true - y_pred
+        self.n += len(y_true)
+        self.sy += centered.sum()
+        self.syy += centered @ centered
+        self.sse += residual @ residual
+        self.sae += np.abs(residual).sum()
+        self.residual_sum += residual.sum()
+        self.residuals.update(residual)
+        return self
+
+    def merge(self, other):
+        """Add the batches seen by another accumulator"""
+        if other.features != self.features:
+            raise ValueError("cannot merge metrics of models with {} and {} features".format(
+                self.features, other.features))
+        if not other.n:
+            return self
+        if self.shift is None:
+            self.shift = other.shift
+        d = other.shift - self.shift
+        # sums about other.shift moved to self.shift
+        self.syy += other.syy + 2 * d * other.sy + other.n * d * d
+        self.sy += other.sy + other.n * d
+        self.n += other.n
+        self.sse += other.sse
+        self.sae += other.sae
+        self.residual_sum += other.residual_sum
+        self.residuals.merge(other.residuals)
+        return self
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    @property
+    def mse(self):
+        return self.sse / self.n if self.n else np.nan
+
+    @property
+    def rmse(self):
+        return np.sqrt(self.mse)
+
+    @property
+    def mae(self):
+        return self.sae / self.n if self.n else np.nan
+
+    @property
+    def bias(self):
+        """Mean residual, y_true - y_pred"""
+        return self.residual_sum / self.n if self.n else np.nan
+
+    @property
+    def tss(self):
+        return self.syy - self.sy * self.sy / self.n if self.n else np.nan
+
+    @property
+    def rsquared(self):
+        return 1.0 - self.sse / self.tss if self.n else np.nan
+
+    @property
+    def rsquared_adj(self):
+        if self.features is None or self.n - self.features - 1 <= 0:
+            return np.nan
+        return 1.0 - (1.0 - self.rsquared) * (self.n - 1) / (self.n - self.features - 1)
+
+    def residual_quantiles(self, qs=QUANTILES):
+        """Approximate residual quantiles (rank error within 3.3 / k at 99% confidence, see analysis.sketch)"""
+        return pd.Series(self.residuals.quantile(qs), index=qs)
+
+    def summary(self, qs=QUANTILES):
+        """All metrics as one series, residual quantiles as residual_q<q>"""
+        values = {'n': self.n, 'mse': self.mse, 'rmse': self.rmse, 'mae': self.mae, 'bias': self.bias,
+                  'rsquared': self.rsquared, 'rsquared_adj': self.rsquared_adj}
+        for q, value in self.residual_quantiles(qs).items():
+            values['residual_q{:g}'.format(q)] = value
+        return pd.Series(values)
+
+
+def evaluate(predict, chunks, target, features=None, k=DEFAULT_K, seed=None):
+    """
+    Metrics of a model over a chunked test set
+    predict: callable from a frame to predictions, e.g. OLSResult.predict,
+             LinearModel.predict or a fitted sklearn model's predict
+    chunks: iterable of frames holding the regressors and the target
+    target: name of the observed column
+    features: number of regressors, for adjusted R^2
+    """
+    metrics = RegressionMetrics(features, k, seed)
+    for chunk in chunks:
+        metrics.update(chunk[target], predict(chunk))
+    return metrics
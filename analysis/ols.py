@@ -0,0 +1,247 @@
+"""
+Ordinary least squares from sufficient statistics.
+
+The car script fits the same data twice, LinearRegression for
+coefficients and R^2 and smf.ols for adjusted R^2, standard errors and
+summary(). OLSAccumulator streams over chunks once, keeping the Gram
+matrix of [1, X, y] (which holds XᵀX, Xᵀy and yᵀy), and fit() derives
+coefficients, R^2, adjusted R^2, standard errors, t and p values from it
+alone. Accumulators from several workers merge by adding their matrices.
+
+The Gram matrix is kept about a per-column shift (the first batch's
+means) so large offsets do not swamp the variances; the normal equations
+are solved by Cholesky, falling back to an SVD least-squares solve when
+XᵀX is singular (a rank-deficient design, e.g. all three origin dummies
+plus an intercept).
+"""
+import numpy as np
+import pandas as pd
+
+from analysis.profiling import profiled
+
+
+def _t_sf(t, df):
+    """Survival function of Student's t"""
+    from scipy import stats
+    return stats.t.sf(t, df)
+
+
+class OLSResult:
+    """
+    Fitted coefficients and their statistics
+    names: regressor names, 'Intercept' first when fitted with one
+    rank: rank of the design (default the number of names); degrees of
+          freedom count the identified parameters only, as statsmodels
+    """
+
+    def __init__(self, names, params, cov, n, rss, tss, df_model, rank_deficient, rank=None):
+        self.names = list(names)
+        self.params = pd.Series(params, index=self.names)
+        self.cov = pd.DataFrame(cov, index=self.names, columns=self.names)
+        self.nobs = n
+        self.rss = rss
+        self.tss = tss
+        self.df_model = df_model
+        self.rank = len(self.names) if rank is None else rank
+        self.df_resid = n - self.rank
+        self.rank_deficient = rank_deficient
+
+    @property
+    def intercept(self):
+        return self.params.get('Intercept', 0.0)
+
+    @property
+    def coef(self):
+        return self.params.drop('Intercept', errors='ignore')
+
+    @property
+    def rsquared(self):
+        return 1.0 - self.rss / self.tss
+
+    @property
+    def rsquared_adj(self):
+        centered = 1 if 'Intercept' in self.params else 0
+        return 1.0 - (1.0 - self.rsquared) * (self.nobs - centered) / self.df_resid
+
+    @property
+    def mse_resid(self):
+        return self.rss / self.df_resid
+
+    @property
+    def bse(self):
+        return pd.Series(np.sqrt(np.diag(self.cov.to_numpy())), index=self.names)
+
+    @property
+    def tvalues(self):
+        return self.params / self.bse
+
+    @property
+    def pvalues(self):
+        return pd.Series(2 * _t_sf(np.abs(self.tvalues.to_numpy()), self.df_resid), index=self.names)
+
+    def summary(self):
+        """Coefficient table in the layout of statsmodels' summary()"""
+        return pd.DataFrame({'coef': self.params, 'std err': self.bse, 't': self.tvalues,
+                             'P>|t|': self.pvalues})
+
+    @profiled('predict')
+    def predict(self, x):
+        """Predictions for a frame or array with the regressors in fit order"""
+        coef = self.coef
+        values = x[list(coef.index)].to_numpy(dtype=np.float64) if isinstance(x, pd.DataFrame) \
+            else np.asarray(x, dtype=np.float64)
+        return values @ coef.to_numpy() + self.intercept
+
+
+class OLSAccumulator:
+    """
+    Streaming sufficient statistics of y ~ X
+    names: regressor names (default the columns of the first frame)
+    intercept: fit an intercept (default True)
+    """
+
+    def __init__(self, names=None, intercept=True):
+        self.names = list(names) if names is not None else None
+        self.intercept = intercept
+        self.shift = None
+        self.gram = None
+
+    def update(self, x, y):
+        """
+        Add a chunk of rows
+        x: frame or 2-D array of regressors
+        y: series or 1-D array of the target
+        """
+        if isinstance(x, pd.DataFrame):
+            if self.names is None:
+                self.names = list(x.columns)
+            x = x[self.names]
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64).reshape(-1, 1)
+        if self.names is None:
+            self.names = ['x{}'.format(i) for i in range(x.shape[1])]
+        if not len(x):
+            return self
+        z = np.hstack([x, y])
+        if self.shift is None:
+            # without an intercept the model is not shift invariant
+            self.shift = z.mean(axis=0) if self.intercept else np.zeros(z.shape[1])
+            self.gram = np.zeros((z.shape[1] + 1, z.shape[1] + 1))
+        z = np.hstack([np.ones((len(z), 1)), z - self.shift])
+        self.gram += z.T @ z
+        return self
+
+    def _reshift(self, shift):
+        # rows of [1, x - s] become [1, x - s'] = [1, x - s] + d with d = [0, s - s']
+        d = np.concatenate([[0.0], self.shift - shift])
+        sums = self.gram[:, 0]
+        self.gram = self.gram + np.outer(sums, d) + np.outer(d, sums) + self.gram[0, 0] * np.outer(d, d)
+        self.shift = shift
+
+    def merge(self, other):
+        """Add the statistics of another accumulator over the same regressors"""
+        if other.gram is None:
+            return self
+        if self.gram is None:
+            self.names, self.shift, self.gram = list(other.names), other.shift.copy(), other.gram.copy()
+            return self
+        if other.names != self.names or other.intercept != self.intercept:
+            raise ValueError("cannot merge accumulators over different regressors")
+        shifted = other.copy()
+        shifted._reshift(self.shift)
+        self.gram += shifted.gram
+        return self
+
+    def copy(self):
+        result = OLSAccumulator(self.names, self.intercept)
+        if self.gram is not None:
+            result.shift, result.gram = self.shift.copy(), self.gram.copy()
+        return result
+
+    def reindex(self, names):
+        """
+        Copy over names, which must include every current regressor; the
+        added ones were 0 on every row accumulated so far
+        """
+        names = list(names)
+        dropped = [name for name in self.names or [] if name not in names]
+        if dropped:
+            raise ValueError("reindex cannot drop regressors: {}".format(dropped))
+        result = OLSAccumulator(names, self.intercept)
+        if self.gram is not None:
+            # a column of zeros adds zero rows and columns, about a shift of 0
+            idx = [0] + [names.index(name) + 1 for name in self.names] + [len(names) + 1]
+            result.gram = np.zeros((len(names) + 2, len(names) + 2))
+            result.gram[np.ix_(idx, idx)] = self.gram
+            result.shift = np.zeros(len(names) + 1)
+            result.shift[np.array(idx[1:]) - 1] = self.shift
+        return result
+
+    @property
+    def nobs(self):
+        return 0 if self.gram is None else int(round(self.gram[0, 0]))
+
+    def subset(self, names):
+        """Gram blocks (XᵀX, Xᵀy, yᵀy, n) of a subset of regressors, shifted coordinates"""
+        idx = [self.names.index(name) + 1 for name in names]
+        if self.intercept:
+            idx = [0] + idx
+        return (self.gram[np.ix_(idx, idx)], self.gram[idx, -1], self.gram[-1, -1], self.gram[0, 0])
+
+    @profiled('ols_fit')
+    def fit(self, names=None):
+        """
+        Solve the normal equations
+        names: regressors to use (default all), in any order
+        """
+        if self.gram is None:
+            raise ValueError("no rows accumulated")
+        names = list(names) if names is not None else self.names
+        xtx, xty, yty, n = self.subset(names)
+        try:
+            factor = np.linalg.cholesky(xtx)
+            pivots = np.diag(factor) ** 2
+            if pivots.min() <= 1e-12 * pivots.max():
+                # collinear columns can still factor, with a vanishing pivot
+                raise np.linalg.LinAlgError("XᵀX is numerically singular")
+            beta = np.linalg.solve(factor.T, np.linalg.solve(factor, xty))
+            inverse = np.linalg.inv(factor)
+            inverse = inverse.T @ inverse
+            rank = len(beta)
+            rank_deficient = False
+        except np.linalg.LinAlgError:
+            # lstsq's SVD gives the minimum-norm solution and the rank
+            beta, _, rank, _ = np.linalg.lstsq(xtx, xty, rcond=None)
+            inverse = np.linalg.pinv(xtx)
+            rank_deficient = True
+        rss = max(yty - beta @ xty, 0.0)
+        sum_y = self.gram[0, -1]
+        tss = yty - sum_y * sum_y / n if self.intercept else yty
+        df_resid = n - rank
+        cov = inverse * (rss / df_resid) if df_resid > 0 else np.full_like(inverse, np.nan)
+
+        # back from shifted to original coordinates
+        shift_x = self.shift[[self.names.index(name) for name in names]]
+        if self.intercept and rank_deficient:
+            # the minimum-norm solution depends on the coordinates; solve
+            # again in the original ones so the parameters and their
+            # errors are the ones statsmodels (pinv of X) reports
+            unshift = np.eye(len(beta))
+            unshift[0, 1:] = shift_x
+            xtx_original = unshift.T @ xtx @ unshift
+            xty_original = unshift.T @ (xty + self.shift[-1] * xtx[:, 0])
+            beta = np.linalg.lstsq(xtx_original, xty_original, rcond=None)[0]
+            inverse = np.linalg.pinv(xtx_original)
+            cov = inverse * (rss / df_resid) if df_resid > 0 else np.full_like(inverse, np.nan)
+            labels = ['Intercept'] + names
+        elif self.intercept:
+            slopes = beta[1:]
+            transform = np.eye(len(beta))
+            transform[0, 1:] = -shift_x
+            beta = np.concatenate([[beta[0] + self.shift[-1] - slopes @ shift_x], slopes])
+            cov = transform @ cov @ transform.T
+            labels = ['Intercept'] + names
+        else:
+            labels = names
+        df_model = rank - 1 if self.intercept else rank
+        return OLSResult(labels, beta, cov, int(round(n)), rss, tss, df_model, rank_deficient, rank)
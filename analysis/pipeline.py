@@ -0,0 +1,79 @@
+"""
+The cells of uber_case_study.py as a memoized analysis.dag.Pipeline.
+
+    raw -> dated -> clean -> cube, summaries, correlation,
+                             borough_hday, hourly
+
+    python -m analysis.pipeline 'Uber_Data new.csv' .pipeline
+
+Editing a stage (or a helper it calls) reruns that stage and the ones
+downstream of it; the EDA stages only depend on clean and run side by
+side.
+"""
+import argparse
+
+from analysis.cleaning import add_date_parts, fill_borough, fill_temp
+from analysis.correlation import NUM_VAR, CorrelationAccumulator
+from analysis.cube import PickupCube
+from analysis.dag import Pipeline, Stage
+from analysis.loader import load_pickups
+from analysis.plots import aggregate
+from analysis.summary import feature_summaries
+
+
+def load(csv):
+    return load_pickups(csv)
+
+
+def date_parts(raw):
+    return add_date_parts(raw)
+
+
+def impute(dated):
+    return fill_temp(fill_borough(dated))
+
+
+def cube(clean):
+    return PickupCube().update(clean)
+
+
+def summaries(clean, features=NUM_VAR):
+    return feature_summaries(clean, features)
+
+
+def correlation(clean, columns=NUM_VAR):
+    return CorrelationAccumulator(columns).update(clean)
+
+
+def grouped(clean, by, y='pickups', estimator='mean'):
+    return aggregate(clean, by, y, estimator)
+
+
+STAGES = [Stage('raw', load, ['csv']),
+          Stage('dated', date_parts, ['raw']),
+          Stage('clean', impute, ['dated']),
+          Stage('cube', cube, ['clean']),
+          Stage('summaries', summaries, ['clean']),
+          Stage('correlation', correlation, ['clean']),
+          Stage('borough_hday', grouped, ['clean'], {'by': ['borough', 'hday']}),
+          Stage('hourly', grouped, ['clean'], {'by': ['borough', 'start_hour'], 'estimator': 'sum'})]
+
+
+def pickup_pipeline(directory, workers=None):
+    """Pipeline of the case study's stages, outputs kept in directory"""
+    return Pipeline(STAGES, directory, workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="run the case study stages, reusing unchanged outputs")
+    parser.add_argument('csv')
+    parser.add_argument('directory')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--target', action='append', dest='targets')
+    args = parser.parse_args(argv)
+    pipeline = pickup_pipeline(args.directory, args.workers).run({'csv': args.csv}, args.targets)
+    print(pipeline.report.to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+Plot helpers that aggregate before drawing.
+
+sns.lineplot(..., estimator='sum') and sns.catplot(kind="bar",
+estimator=np.sum) re-group every raw row for every chart. The helpers
+here take the same arguments, reduce the data once with a vectorized
+group-by (or read it straight from a PickupCube) and hand seaborn only
+one row per group, so drawing cost depends on the number of groups.
+
+histogram_boxplot is the notebook helper; histogram_boxplot_batch draws
+many features on one figure from analysis.summary statistics.
+scatter_matrix replaces sns.pairplot with binned densities or a capped
+sample.
+"""
+import math
+import time
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from matplotlib.colors import LogNorm
+
+from analysis.cube import DIMS, PickupCube
+from analysis.profiling import profiled
+from analysis.summary import feature_summaries
+
+_ESTIMATORS = {np.sum: 'sum', np.mean: 'mean', np.median: 'median', np.min: 'min', np.max: 'max',
+               np.std: 'std', np.var: 'var', len: 'count'}
+
+
+def _estimator_name(estimator):
+    if isinstance(estimator, str):
+        return estimator
+    if estimator in _ESTIMATORS:
+        return _ESTIMATORS[estimator]
+    return estimator
+
+
+@profiled('aggregate')
+def aggregate(data, by, y='pickups', estimator='sum'):
+    """
+    One row per group of by with y reduced by estimator
+    data: dataframe or PickupCube
+    by: column name or list of column names
+    y: column to reduce (default pickups)
+    estimator: name or numpy function (default 'sum')
+    """
+    by = [col for col in ([by] if isinstance(by, str) else by) if col is not None]
+    by = list(dict.fromkeys(by))
+    estimator = _estimator_name(estimator)
+    if isinstance(data, PickupCube):
+        if y != 'pickups' or not set(by) <= set(DIMS):
+            raise ValueError("a PickupCube only holds pickups by {}".format(DIMS))
+        return data.rollup(by, estimator).rename(y).reset_index()
+    return data.groupby(by, observed=True, sort=True)[y].agg(estimator).reset_index()
+
+
+def _no_errorbar(kwargs):
+    # the notebook passes ci=False, which newer seaborn spells errorbar=None;
+    # either way there is one value per group, so nothing to draw
+    kwargs.pop('ci', None)
+    kwargs['errorbar'] = None
+    return kwargs
+
+
+def lineplot(data, x, y='pickups', hue=None, estimator='mean', ax=None, **kwargs):
+    """
+    sns.lineplot over the aggregated series
+    data: dataframe or PickupCube
+    x, y, hue, estimator, ax: as for sns.lineplot
+    """
+    reduced = aggregate(data, [x, hue], y, estimator)
+    return sns.lineplot(data=reduced, x=x, y=y, hue=hue, ax=ax, **_no_errorbar(kwargs))
+
+
+def barplot(data, x, y='pickups', hue=None, estimator='mean', ax=None, **kwargs):
+    """
+    sns.barplot over the aggregated series
+    data: dataframe or PickupCube
+    x, y, hue, estimator, ax: as for sns.barplot
+    """
+    reduced = aggregate(data, [x, hue], y, estimator)
+    return sns.barplot(data=reduced, x=x, y=y, hue=hue, ax=ax, **_no_errorbar(kwargs))
+
+
+def catplot(data, x, y='pickups', hue=None, col=None, row=None, kind='bar', estimator='mean', **kwargs):
+    """
+    sns.catplot(kind='bar' or 'point') over the aggregated series
+    data: dataframe or PickupCube
+    x, y, hue, col, row, kind, estimator: as for sns.catplot
+    """
+    if kind not in ('bar', 'point'):
+        raise ValueError("only bar and point catplots can be drawn from aggregates, got {}".format(kind))
+    reduced = aggregate(data, [x, hue, col, row], y, estimator)
+    return sns.catplot(data=reduced, x=x, y=y, hue=hue, col=col, row=row, kind=kind, **_no_errorbar(kwargs))
+
+
+def histogram_boxplot(data, feature, figsize=(12, 7), kde=False, bins=None):
+    """
+    Boxplot and histogram combined
+    data: dataframe
+    feature: dataframe column
+    figsize: size of figure (default (12,7))
+    kde: whether to show the density curve (default False)
+    bins: number of bins for histogram (default None)
+    """
+    f2, (ax_box2, ax_hist2) = plt.subplots(
+        nrows=2,  # Number of rows of the subplot grid= 2
+        sharex=True,  # x-axis will be shared among all subplots
+        gridspec_kw={"height_ratios": (0.25, 0.75)},
+        figsize=figsize)  # creating the 2 subplots
+    sns.boxplot(data=data, x=feature, ax=ax_box2, showmeans=True, color="mediumturquoise")
+    if bins:
+        sns.histplot(data=data, x=feature, kde=kde, ax=ax_hist2, bins=bins, color="mediumpurple")
+    else:
+        sns.histplot(data=data, x=feature, kde=kde, ax=ax_hist2, color="mediumpurple")
+    ax_hist2.axvline(data[feature].mean(), color="green", linestyle="--")  # Add mean to the histogram
+    ax_hist2.axvline(data[feature].median(), color="black", linestyle="-")  # Add median to the histogram
+    return f2
+
+
+def draw_histogram_boxplot(stats, ax_box, ax_hist, feature=None):
+    """
+    Draw one histogram_boxplot panel from precomputed statistics
+    stats: one entry of analysis.summary.feature_summaries
+    ax_box, ax_hist: axes for the boxplot and the histogram
+    """
+    box = dict(stats, label=feature or '')
+    ax_box.bxp([box], vert=False, showmeans=True, patch_artist=True, widths=0.6,
+               boxprops={'facecolor': 'mediumturquoise'})
+    ax_box.set_yticks([])
+    ax_hist.stairs(stats['counts'], stats['edges'], fill=True, color="mediumpurple", alpha=0.75)
+    ax_hist.axvline(stats['mean'], color="green", linestyle="--")  # mean
+    ax_hist.axvline(stats['med'], color="black", linestyle="-")  # median
+    ax_hist.set_xlabel(feature or '')
+    ax_hist.set_ylabel('Count')
+
+
+def histogram_boxplot_batch(source, features, bins=None, ncols=3, figsize=None, summaries=None):
+    """
+    histogram_boxplot for many features on one figure grid
+    source: dataframe, list of frames or callable returning an iterator of frames
+    features: list of numeric columns
+    bins: number of histogram bins (default numpy's 'auto' rule)
+    ncols: features per row of the grid (default 3)
+    figsize: size of figure (default 6 x 4 per feature)
+    summaries: statistics from feature_summaries, computed when not given
+
+    Returns the figure and the summaries it was drawn from.
+    """
+    features = list(features)
+    if summaries is None:
+        summaries = feature_summaries(source, features, bins=bins)
+    ncols = min(ncols, len(features))
+    nrows = math.ceil(len(features) / ncols)
+    figure = plt.figure(figsize=figsize or (6 * ncols, 4 * nrows))
+    grid = figure.add_gridspec(2 * nrows, ncols, height_ratios=[0.25, 0.75] * nrows)
+    for i, feature in enumerate(features):
+        row, col = divmod(i, ncols)
+        ax_hist = figure.add_subplot(grid[2 * row + 1, col])
+        ax_box = figure.add_subplot(grid[2 * row, col], sharex=ax_hist)
+        ax_box.tick_params(labelbottom=False)
+        draw_histogram_boxplot(summaries[feature], ax_box, ax_hist, feature)
+    figure.tight_layout()
+    return figure, summaries
+
+
+def sketch_boxplots(sketches, columns=None, ncols=4, figsize=(15, 12), fliers=None):
+    """
+    The notebook's outlier grid (plt.boxplot per column, whis=1.5) drawn
+    from quantile sketches instead of sorted columns
+    sketches: analysis.sketch.ColumnSketches
+    columns: columns to draw (default all sketched columns)
+    ncols: boxplots per row (default 4)
+    fliers: optional {column: outlier values} to draw as points
+    """
+    columns = list(columns or sketches.columns)
+    stats = sketches.boxplot_stats()
+    nrows = math.ceil(len(columns) / ncols)
+    figure = plt.figure(figsize=figsize)
+    for i, variable in enumerate(columns):
+        ax = figure.add_subplot(nrows, ncols, i + 1)
+        box = dict(stats[variable], label='')
+        if fliers and variable in fliers:
+            box['fliers'] = np.asarray(fliers[variable])
+        ax.bxp([box])
+        ax.set_title(variable)
+    figure.tight_layout()
+    return figure
+
+
+def _sample(data, size, strata=None, seed=0):
+    if len(data) <= size:
+        return data
+    if strata is None:
+        return data.sample(n=size, random_state=seed)
+    # same fraction from every stratum, so small groups keep their share
+    fraction = size / len(data)
+    return data.groupby(strata, observed=True, dropna=False, group_keys=False).sample(frac=fraction, random_state=seed)
+
+
+def scatter_matrix(data, vars=None, mode='density', bins=40, sample_size=20_000, strata=None, figsize=None):
+    """
+    Scatter matrix for large frames, in place of sns.pairplot(diag_kind='kde')
+    data: dataframe
+    vars: columns to plot (default every numeric column, as pairplot)
+    mode: 'density' draws 2-D binned counts, 'sample' scatters a capped
+          sample (default 'density')
+    bins: bins per axis of the densities and diagonal histograms (default 40)
+    sample_size: rows kept in 'sample' mode (default 20000)
+    strata: column to stratify the sample by, e.g. 'borough' (default none)
+    figsize: size of figure (default 2.5 per panel)
+
+    Diagonals are histograms, not per-point KDEs. Returns the figure and a
+    frame of per-panel seconds (computing and drawing the panel).
+    """
+    if mode not in ('density', 'sample'):
+        raise ValueError("mode must be 'density' or 'sample', got {}".format(mode))
+    vars = list(vars) if vars is not None else data.select_dtypes('number').columns.tolist()
+    k = len(vars)
+    figure, axes = plt.subplots(k, k, figsize=figsize or (2.5 * k, 2.5 * k), squeeze=False)
+    values = data[vars].to_numpy(dtype=np.float64)
+    if mode == 'sample':
+        sampled = _sample(data, sample_size, strata)[vars].to_numpy(dtype=np.float64)
+    seconds = np.zeros((k, k))
+    edges = []
+    for i in range(k):
+        column = values[:, i]
+        column = column[~np.isnan(column)]
+        low, high = (column.min(), column.max()) if len(column) else (0.0, 1.0)
+        edges.append(np.linspace(low, high if high > low else low + 1, bins + 1))
+    for i in range(k):
+        for j in range(k):
+            start = time.perf_counter()
+            ax = axes[i, j]
+            if i == j:
+                column = values[:, i]
+                counts, _ = np.histogram(column[~np.isnan(column)], bins=edges[i])
+                ax.stairs(counts, edges[i], fill=True, color="steelblue")
+            elif mode == 'density':
+                x, y = values[:, j], values[:, i]
+                present = ~(np.isnan(x) | np.isnan(y))
+                counts, _, _ = np.histogram2d(x[present], y[present], bins=[edges[j], edges[i]])
+                counts = np.ma.masked_equal(counts.T, 0)
+                if counts.count():
+                    ax.pcolormesh(edges[j], edges[i], counts, cmap="Blues", rasterized=True,
+                                  norm=LogNorm(vmin=1, vmax=max(counts.max(), 2)))
+            else:
+                ax.scatter(sampled[:, j], sampled[:, i], s=2, alpha=0.3, linewidths=0, rasterized=True)
+            if i == k - 1:
+                ax.set_xlabel(vars[j])
+            else:
+                ax.tick_params(labelbottom=False)
+            if j == 0:
+                ax.set_ylabel(vars[i])
+            else:
+                ax.tick_params(labelleft=False)
+            seconds[i, j] = time.perf_counter() - start
+    figure.tight_layout()
+    return figure, pd.DataFrame(seconds, index=vars, columns=vars)
@@ -0,0 +1,287 @@
+"""
+Per-stage timing and memory instrumentation.
+
+Nothing tells which steps of the case study or of the car regression
+dominate time and memory at production sizes. The main steps of this
+package (load, datetime parse, date parts, cleaning and imputation,
+aggregation, each report figure, OLS fit and predict) are wrapped in
+named stages. When profiling is enabled every stage records
+
+- wall and CPU seconds,
+- the peak RSS above the RSS at entry (sampled by a background thread),
+- the rows it processed,
+
+as one json line per call in a structured log, and summary() reduces the
+records to one row per stage. With a flame directory the same thread
+also samples the stack of the profiled thread and writes one folded
+stack file per stage (flamegraph.pl / speedscope input).
+
+Disabled, a wrapped function costs one global lookup per call. Enable
+in code with enable(), or for every process of a run with the
+ANALYSIS_PROFILE=<log path> (and ANALYSIS_PROFILE_FLAME=<directory>)
+environment variables. Forked pool workers keep profiling into the same
+log, their flame files go to a subdirectory named after their pid.
+
+    from analysis import profiling
+    profiling.enable('profile.jsonl', flame='flames')
+    with profiling.stage('fit', rows=len(x)):
+        model.fit(x, y)
+    profiling.disable()
+    profiling.summary()
+"""
+import atexit
+import functools
+import json
+import multiprocessing.util
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+INTERVAL = 0.005
+ENVIRONMENT = 'ANALYSIS_PROFILE'
+
+_active = None
+
+
+def _rss():
+    """Current resident set size in bytes (peak size where /proc is not available)"""
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _frames(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+class Profiler:
+    """
+    Collector behind enable()
+    log: path of the json-lines log, appended to (default none)
+    flame: directory for folded stack files per stage (default none)
+    interval: seconds between RSS and stack samples (default 0.005)
+    """
+
+    def __init__(self, log=None, flame=None, interval=INTERVAL):
+        self.log = log
+        self.flame = flame
+        self.interval = interval
+        self.records = []
+        self.stacks = {}
+        self._open = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='profiling-sampler', daemon=True)
+        if flame:
+            os.makedirs(flame, exist_ok=True)
+        self._thread.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = _rss()
+            with self._lock:
+                for record in self._open:
+                    record['_peak'] = max(record['_peak'], rss)
+                innermost = self._open[-1] if self._open else None
+            if self.flame and innermost is not None:
+                frame = sys._current_frames().get(innermost['_thread'])
+                if frame is not None:
+                    self.stacks.setdefault(innermost['stage'], Counter())[_frames(frame)] += 1
+
+    def begin(self, name, rows=None):
+        rss = _rss()
+        record = {'stage': name, 'path': '/'.join([r['stage'] for r in self._open] + [name]), 'pid': os.getpid(),
+                  'start': time.time(), 'rows': rows, '_rss': rss, '_peak': rss,
+                  '_thread': threading.get_ident(), '_wall': time.perf_counter(), '_cpu': time.process_time()}
+        with self._lock:
+            self._open.append(record)
+        return record
+
+    def end(self, record, error=None):
+        wall, cpu = time.perf_counter() - record['_wall'], time.process_time() - record['_cpu']
+        rss = _rss()
+        with self._lock:
+            self._open.remove(record)
+        peak = max(record['_peak'], rss)
+        row = {'stage': record['stage'], 'path': record['path'], 'pid': record['pid'], 'start': record['start'],
+               'wall_s': wall, 'cpu_s': cpu, 'rss_mb': record['_rss'] / 2 ** 20,
+               'peak_rss_delta_mb': (peak - record['_rss']) / 2 ** 20,
+               'rows': None if record['rows'] is None else int(record['rows']), 'error': error}
+        self.records.append(row)
+        if self.log:
+            with open(self.log, 'a') as handle:
+                handle.write(json.dumps(row) + '\n')
+        return row
+
+    def write_flames(self):
+        """Write <flame>/<stage>.folded for every sampled stage"""
+        if not self.flame:
+            return []
+        paths = []
+        for name, stacks in self.stacks.items():
+            path = os.path.join(self.flame, '{}.folded'.format(name.replace(os.sep, '_').replace(' ', '_')))
+            with open(path, 'w') as handle:
+                for stack, count in stacks.most_common():
+                    handle.write('{} {}\n'.format(stack, count))
+            paths.append(path)
+        return paths
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.write_flames()
+
+
+def enable(log=None, flame=None, interval=INTERVAL):
+    """Start recording stages; returns the Profiler"""
+    global _active
+    disable()
+    _active = Profiler(log, flame, interval)
+    return _active
+
+
+def disable():
+    """Stop recording, write flame files; returns the records of the run"""
+    global _active
+    profiler, _active = _active, None
+    if profiler is None:
+        return []
+    profiler.close()
+    return profiler.records
+
+
+def enabled():
+    return _active is not None
+
+
+def records():
+    """Records of the current run as a frame"""
+    return pd.DataFrame(_active.records if _active is not None else [])
+
+
+class stage:
+    """
+    Context manager timing a block as a named stage
+    name: stage name
+    rows: rows processed, or set .rows on the stage inside the block
+    """
+
+    __slots__ = ('name', 'rows', '_record')
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self._record = None
+
+    def __enter__(self):
+        if _active is not None:
+            self._record = _active.begin(self.name)
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        if self._record is not None and _active is not None:
+            self._record['rows'] = self.rows
+            _active.end(self._record, kind.__name__ if kind is not None else None)
+        return False
+
+
+def _rows(args, result):
+    for value in tuple(args) + (result,):
+        if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+            return value.shape[0] if value.ndim else None
+    return None
+
+
+def profiled(name=None):
+    """
+    Decorator recording every call of a function as a stage
+    name: stage name (default the function's qualified name)
+
+    Rows are the length of the first frame or array argument, or of the
+    result when there is none (a loader).
+    """
+    def decorate(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _active
+            if profiler is None:
+                return func(*args, **kwargs)
+            record = profiler.begin(label)
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as error:
+                profiler.end(record, type(error).__name__)
+                raise
+            record['rows'] = _rows(args, result)
+            profiler.end(record)
+            return result
+        return wrapper
+    return decorate
+
+
+def read_log(path):
+    """Records of a json-lines log (e.g. written by several processes)"""
+    with open(path) as handle:
+        return pd.DataFrame([json.loads(line) for line in handle if line.strip()])
+
+
+def summary(source=None):
+    """
+    One row per stage, slowest first
+    source: frame of records or a log path (default the current run)
+
+    calls, total and mean wall seconds, CPU seconds, CPU share of wall,
+    the largest peak RSS delta, total rows and rows per wall second.
+    """
+    if source is None:
+        frame = records()
+    elif isinstance(source, str):
+        frame = read_log(source)
+    else:
+        frame = pd.DataFrame(source)
+    if frame.empty:
+        return pd.DataFrame(columns=['calls', 'wall_s', 'mean_wall_s', 'cpu_s', 'cpu_share',
+                                     'peak_rss_delta_mb', 'rows', 'rows_per_s'])
+    frame = frame.assign(rows=pd.to_numeric(frame['rows'], errors='coerce'))
+    table = frame.groupby('stage').agg(calls=('wall_s', 'size'), wall_s=('wall_s', 'sum'),
+                                       mean_wall_s=('wall_s', 'mean'), cpu_s=('cpu_s', 'sum'),
+                                       peak_rss_delta_mb=('peak_rss_delta_mb', 'max'),
+                                       rows=('rows', lambda rows: rows.sum(min_count=1)))
+    table.insert(4, 'cpu_share', table['cpu_s'] / table['wall_s'])
+    table['rows_per_s'] = table['rows'] / table['wall_s']
+    return table.sort_values('wall_s', ascending=False)
+
+
+def _after_fork():
+    # the sampler thread does not survive fork, give a forked worker its own
+    global _active
+    if _active is not None:
+        profiler = _active
+        _active = Profiler(profiler.log, profiler.flame and os.path.join(profiler.flame, str(os.getpid())),
+                           profiler.interval)
+        # pool workers leave through os._exit, which skips atexit
+        multiprocessing.util.Finalize(None, disable, exitpriority=0)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+if os.environ.get(ENVIRONMENT):
+    enable(os.environ[ENVIRONMENT], os.environ.get(ENVIRONMENT + '_FLAME') or None)
+    atexit.register(disable)
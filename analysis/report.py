@@ -0,0 +1,313 @@
+"""
+Headless, parallel rendering of the case study's figures.
+
+The notebook draws its ~25 charts one after another through the inline
+backend and plt.show(), so the export cannot run outside Jupyter.
+render_report draws them with the Agg backend in a process pool and
+writes one PNG (and/or SVG) per figure plus an index.html.
+
+Workers never see the cleaned frame: the parent reduces it once (a
+PickupCube, feature_summaries, the correlation matrix, per-borough box
+and letter-value statistics, a capped stratified sample for the pair
+plot) and each task carries only the small payload its figure needs.
+
+    python -m analysis.report 'Uber_Data new.csv' report --format png svg
+
+The returned frame, also shown in the index, holds per figure the
+seconds spent preparing its payload, the seconds spent drawing and
+saving it, and the file size. With --cache DIRECTORY (an
+analysis.figcache.FigureCache) figures whose payload is unchanged are
+copied from earlier runs instead of drawn.
+"""
+import argparse
+import html
+import math
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+from analysis.cleaning import clean_pickups
+from analysis.correlation import NUM_VAR, CorrelationAccumulator
+from analysis.cube import PickupCube
+from analysis.figcache import FigureCache
+from analysis.loader import load_pickups
+from analysis.plots import _sample, aggregate, barplot, draw_histogram_boxplot, lineplot, scatter_matrix
+from analysis.profiling import stage
+from analysis.summary import feature_summaries
+
+FORMATS = ('png', 'svg')
+PAIRPLOT_ROWS = 20_000
+# letter-value plots show the tails as points beyond the last box; keep at most this many
+BOXEN_OUTLIERS = 2_000
+
+
+def _headless():
+    matplotlib.use('Agg', force=True)
+
+
+def _figure(figsize=(10, 5), **kwargs):
+    import matplotlib.pyplot as plt
+    return plt.subplots(figsize=figsize, **kwargs)
+
+
+def render_histbox(payload):
+    import matplotlib.pyplot as plt
+    figure, (ax_box, ax_hist) = plt.subplots(nrows=2, sharex=True, figsize=(12, 7),
+                                             gridspec_kw={"height_ratios": (0.25, 0.75)})
+    draw_histogram_boxplot(payload['stats'], ax_box, ax_hist, payload['feature'])
+    return figure
+
+
+def render_count(payload):
+    figure, ax = _figure()
+    counts = payload['counts']
+    ax.bar([str(label) for label in counts.index], counts.to_numpy())
+    ax.set_xlabel(counts.index.name)
+    ax.set_ylabel('count')
+    return figure
+
+
+def render_heatmap(payload):
+    import seaborn as sns
+    figure, ax = _figure((12, 7))
+    sns.heatmap(payload['corr'], annot=True, vmin=-1, vmax=1, fmt=".2f", cmap="Spectral", ax=ax)
+    return figure
+
+
+def render_pairplot(payload):
+    # binned densities: a 20k-point scatter in 90 panels is slow to draw and huge as svg
+    return scatter_matrix(payload['sample'], mode='density')[0]
+
+
+def render_line(payload):
+    figure, ax = _figure(payload.get('figsize', (10, 5)))
+    kwargs = {'color': 'red'} if payload.get('hue') is None else {}
+    lineplot(payload['data'], payload['x'], hue=payload.get('hue'), ax=ax, **kwargs)
+    return figure
+
+
+def render_bar(payload):
+    figure, ax = _figure()
+    barplot(payload['data'], payload['x'], hue=payload.get('hue'), ax=ax)
+    return figure
+
+
+def render_box(payload):
+    figure, ax = _figure((15, 7))
+    ax.bxp(payload['stats'])
+    ax.set_xlabel('borough')
+    ax.set_ylabel('pickups')
+    return figure
+
+
+def render_boxen(payload):
+    from matplotlib.patches import Rectangle
+    groups = payload['groups']
+    ncols = min(4, len(groups))
+    nrows = math.ceil(len(groups) / ncols)
+    figure, axes = _figure((4 * ncols, 3 * nrows), nrows=nrows, ncols=ncols, squeeze=False, sharex=True)
+    for ax, (label, levels) in zip(axes.ravel(), groups.items()):
+        depth = len(levels['lower'])
+        for i, (low, high) in enumerate(zip(levels['lower'], levels['upper'])):
+            height = 0.8 * (1 - i / (depth + 1))
+            ax.add_patch(Rectangle((low, -height / 2), high - low, height, facecolor='steelblue',
+                                   alpha=0.3 + 0.7 * (1 - i / depth), edgecolor='white'))
+        ax.plot([levels['median']] * 2, [-0.4, 0.4], color='black')
+        ax.scatter(levels['outliers'], np.zeros(len(levels['outliers'])), s=4, color='steelblue')
+        ax.set_ylim(-0.5, 0.5)
+        ax.set_yticks([])
+        ax.set_title('borough = {}'.format(label))
+        ax.set_xlabel('pickups')
+        ax.autoscale_view(scaley=False)
+    for ax in axes.ravel()[len(groups):]:
+        ax.set_visible(False)
+    return figure
+
+
+def letter_values(values, outliers=BOXEN_OUTLIERS):
+    """
+    Letter-value (boxen) statistics of one group
+    values: 1-D array
+    Levels follow seaborn's 'tukey' depth, log2(n) - 3 boxes.
+    """
+    values = np.sort(values[~np.isnan(values)])
+    n = len(values)
+    depth = max(1, int(np.log2(max(n, 2))) - 3)
+    tails = 0.5 ** np.arange(2, depth + 2)
+    lower, upper = np.quantile(values, tails), np.quantile(values, 1 - tails)
+    beyond = values[(values < lower[-1]) | (values > upper[-1])]
+    if len(beyond) > outliers:
+        beyond = beyond[np.linspace(0, len(beyond) - 1, outliers).astype(int)]
+    return {'lower': lower, 'upper': upper, 'median': np.median(values) if n else np.nan, 'outliers': beyond}
+
+
+def figure_specs(df):
+    """
+    (name, renderer, payload, prepare seconds) of every figure
+    df: cleaned pickup frame
+    """
+    from matplotlib import cbook
+
+    specs = []
+    start = time.perf_counter()
+
+    def add(name, renderer, payload):
+        nonlocal start
+        now = time.perf_counter()
+        specs.append((name, renderer, payload, now - start))
+        start = now
+
+    summaries = feature_summaries(df, NUM_VAR)
+    for feature in NUM_VAR:
+        add('histogram_boxplot_' + feature, render_histbox, {'stats': summaries[feature], 'feature': feature})
+    for column in ['hday', 'borough']:
+        add('count_' + column, render_count, {'counts': df[column].value_counts(sort=False).sort_index()})
+    add('heatmap', render_heatmap, {'corr': CorrelationAccumulator(NUM_VAR).update(df).corr()})
+    sample = _sample(df[NUM_VAR + ['borough']], PAIRPLOT_ROWS, 'borough')
+    add('pairplot', render_pairplot, {'sample': sample[NUM_VAR]})
+
+    cube = PickupCube().update(df)
+    for x in ['start_month', 'start_day', 'start_hour', 'week_day']:
+        add('line_' + x, render_line, {'data': aggregate(cube, x), 'x': x})
+    add('line_start_day_not_feb', render_line,
+        {'data': aggregate(df[df['start_month'] != 'February'], 'start_day'), 'x': 'start_day'})
+    add('line_start_hour_by_borough', render_line,
+        {'data': aggregate(cube, ['start_hour', 'borough']), 'x': 'start_hour', 'hue': 'borough',
+         'figsize': (15, 7)})
+    add('bar_hday', render_bar, {'data': aggregate(cube, 'hday'), 'x': 'hday'})
+    add('bar_borough_hday', render_bar,
+        {'data': aggregate(cube, ['borough', 'hday'], estimator='mean'), 'x': 'borough', 'hue': 'hday'})
+
+    groups = {label: values['pickups'].to_numpy(dtype=np.float64)
+              for label, values in df.groupby('borough', observed=True)[['pickups']]}
+    boxes = [dict(cbook.boxplot_stats(values, whis=1.5)[0], label=label) for label, values in groups.items()]
+    add('box_borough', render_box, {'stats': boxes})
+    add('boxen_borough', render_boxen, {'groups': {label: letter_values(values) for label, values in groups.items()}})
+    return specs
+
+
+def _render(task):
+    name, renderer, payload, base, formats, dpi = task
+    import matplotlib.pyplot as plt
+    start = time.perf_counter()
+    with stage('plot:' + name):
+        figure = renderer(payload)
+        files = []
+        for fmt in formats:
+            path = '{}.{}'.format(base, fmt)
+            figure.savefig(path, dpi=dpi, bbox_inches='tight')
+            files.append(path)
+        plt.close(figure)
+    return files, time.perf_counter() - start
+
+
+def _index(timings, directory):
+    rows = []
+    for name, row in timings.iterrows():
+        link = os.path.basename(row['files'][0])
+        rows.append('<figure><a href="{0}"><img src="{0}" loading="lazy"></a><figcaption>{1} &middot; '
+                    'prepare {2:.3f}s &middot; render {3:.3f}s</figcaption></figure>'.format(
+                        html.escape(link), html.escape(name), row['prepare_s'], row['render_s']))
+    page = ('<!doctype html>\n<html><head><meta charset="utf-8"><title>Uber pickups report</title>\n'
+            '<style>body{{font-family:sans-serif}} figure{{display:inline-block;width:32%;margin:0.5%}} '
+            'img{{width:100%}}</style></head><body>\n<h1>Uber pickups report</h1>\n'
+            '<p>{} figures, rendering {:.2f}s in total</p>\n{}\n</body></html>\n').format(
+                len(timings), timings['render_s'].sum(), '\n'.join(rows))
+    path = os.path.join(directory, 'index.html')
+    with open(path, 'w') as handle:
+        handle.write(page)
+    return path
+
+
+def _from_cache(cache, spec, base, formats, dpi):
+    """Copy a figure's cached files to base.<fmt>; keys per format, or None when any is missing"""
+    name, renderer, payload, _ = spec
+    keys = {fmt: cache.key(renderer, payload, fmt, dpi) for fmt in formats}
+    found = {fmt: cache.get(key, fmt) for fmt, key in keys.items()}
+    if any(path is None for path in found.values()):
+        return keys, None
+    files = []
+    for fmt, path in found.items():
+        shutil.copyfile(path, '{}.{}'.format(base, fmt))
+        files.append('{}.{}'.format(base, fmt))
+    return keys, files
+
+
+def render_report(df, directory, formats=('png',), workers=None, dpi=100, only=None, cache=None):
+    """
+    Draw every figure of the case study into directory
+    df: cleaned pickup frame
+    formats: any of 'png' and 'svg' (default png)
+    workers: processes (default os.cpu_count(); 1 draws in this process)
+    dpi: resolution of png files (default 100)
+    only: names of the figures to draw (default all, see figure_specs)
+    cache: analysis.figcache.FigureCache; figures whose payload, renderer
+           and libraries are unchanged are copied from it, not drawn
+
+    Returns a frame indexed by figure name with prepare_s, render_s,
+    cached, bytes and files; index.html links every figure.
+    """
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError("unsupported formats {}, use {}".format(sorted(unknown), FORMATS))
+    _headless()
+    os.makedirs(directory, exist_ok=True)
+    specs = [spec for spec in figure_specs(df) if only is None or spec[0] in only]
+    results, keys, tasks = {}, {}, []
+    for spec in specs:
+        name, renderer, payload, _ = spec
+        base = os.path.join(directory, name)
+        if cache is not None:
+            keys[name], files = _from_cache(cache, spec, base, formats, dpi)
+            if files is not None:
+                results[name] = (files, 0.0)
+                continue
+        tasks.append((name, renderer, payload, base, tuple(formats), dpi))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) <= 1:
+        drawn = [_render(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_headless) as pool:
+            drawn = list(pool.map(_render, tasks))
+    for task, (files, seconds) in zip(tasks, drawn):
+        results[task[0]] = (files, seconds)
+        if cache is not None:
+            for fmt, path in zip(task[4], files):
+                cache.put(keys[task[0]][fmt], fmt, path)
+    names = [spec[0] for spec in specs]
+    timings = pd.DataFrame({'prepare_s': [spec[3] for spec in specs],
+                            'render_s': [results[name][1] for name in names],
+                            'cached': [name not in {task[0] for task in tasks} for name in names],
+                            'bytes': [sum(os.path.getsize(path) for path in results[name][0]) for name in names],
+                            'files': [results[name][0] for name in names]},
+                           index=pd.Index(names, name='figure'))
+    _index(timings, directory)
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="render the case study figures without a display")
+    parser.add_argument('csv')
+    parser.add_argument('directory')
+    parser.add_argument('--format', nargs='+', default=['png'], choices=FORMATS)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--cache', metavar='DIRECTORY', help="reuse figures rendered by earlier runs")
+    args = parser.parse_args(argv)
+    df = clean_pickups(load_pickups(args.csv))
+    cache = FigureCache(args.cache) if args.cache else None
+    timings = render_report(df, args.directory, args.format, args.workers, args.dpi, cache=cache)
+    print(timings[['prepare_s', 'render_s', 'cached', 'bytes']].to_string())
+    if cache is not None:
+        print(cache.stats())
+    print("{} figures, {:.2f}s rendering, index at {}".format(
+        len(timings), timings['render_s'].sum(), os.path.join(args.directory, 'index.html')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Online recursive least squares of pickups on the weather columns.
+
+The notebook judges the weather effect from one corr() over January to
+June. RecursiveLeastSquares keeps the coefficients of pickups ~ weather
+current as hours arrive: every row updates them in O(p^2) through the
+inverse-Gram matrix P, never touching the history again. A forgetting
+factor below 1 down-weights old batches geometrically, once per update()
+call, so the coefficients follow a relationship that changes with the
+season and the memory is counted in hours, however many rows (boroughs)
+an hour has.
+
+Plain exponential forgetting winds up: a direction no row excites (sd is
+zero most of the year, pcp* on dry hours) loses information every hour
+and its entries of P grow like forgetting^-t until they overflow. The
+forgotten information is therefore replaced by the prior's, the
+information matrix P^-1 decaying toward I / delta rather than toward 0
+(stabilised forgetting), which keeps P below delta * I. Directions the
+data excites are barely affected; an unexcited one keeps its coefficient
+and returns to the prior's uncertainty.
+
+A snapshot of the coefficients is kept after every update() call (one
+per hourly batch), and drift() returns them over time. The whole state
+checkpoints to json and resumes exactly.
+"""
+import json
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from analysis.loader import DATETIME_COLUMN, WEATHER_COLUMNS
+
+DELTA = 1e4
+
+
+class RecursiveLeastSquares:
+    """
+    Online linear regression
+    names: regressors (default WEATHER_COLUMNS)
+    forgetting: weight kept by a batch per later update() call, 1 remembers
+                everything; the memory is about 1 / (1 - forgetting) calls,
+                hours when fed hourly batches (default 1.0)
+    intercept: fit an intercept (default True)
+    delta: initial P = delta * I, large means a weak prior at zero (default 1e4)
+    history: number of coefficient snapshots kept (default all)
+    """
+
+    def __init__(self, names=WEATHER_COLUMNS, forgetting=1.0, intercept=True, delta=DELTA, history=None):
+        if not 0 < forgetting <= 1:
+            raise ValueError("forgetting must be in (0, 1], got {}".format(forgetting))
+        self.names = list(names)
+        self.forgetting = forgetting
+        self.intercept = intercept
+        self.delta = delta
+        width = len(self.names) + (1 if intercept else 0)
+        self.theta = np.zeros(width)
+        self.p = np.eye(width) * delta
+        self.n = 0
+        self.history = deque(maxlen=history)
+
+    @property
+    def labels(self):
+        return (['Intercept'] if self.intercept else []) + self.names
+
+    def _design(self, x):
+        if isinstance(x, pd.DataFrame):
+            x = x[self.names]
+        x = np.asarray(x, dtype=np.float64).reshape(-1, len(self.names))
+        if self.intercept:
+            x = np.hstack([np.ones((len(x), 1)), x])
+        return x
+
+    def update(self, x, y, stamp=None):
+        """
+        Add rows in time order
+        x: frame or 2-D array of the regressors (a single row may be 1-D)
+        y: observed target of each row
+        stamp: time of the batch for the drift history (default the
+               latest pickup_dt of a frame, else the row count)
+        Rows with a missing value are skipped. With forgetting below 1 the
+        earlier batches are down-weighted once per call, even one with no
+        valid rows.
+        """
+        if stamp is None and isinstance(x, pd.DataFrame) and DATETIME_COLUMN in x and len(x):
+            stamp = x[DATETIME_COLUMN].max()
+        x = self._design(x)
+        y = np.asarray(y, dtype=np.float64).ravel()
+        valid = ~(np.isnan(x).any(axis=1) | np.isnan(y))
+        theta, p, lam = self.theta, self.p, self.forgetting
+        if lam != 1.0:
+            # stabilised forgetting: P^-1 <- lam P^-1 + (1 - lam) I / delta, bounded by delta * I
+            information = lam * np.linalg.inv(p) + (1 - lam) / self.delta * np.eye(len(p))
+            p = np.linalg.inv(information)
+        for row, target in zip(x[valid], y[valid]):
+            px = p @ row
+            gain = px / (1.0 + row @ px)
+            theta += gain * (target - row @ theta)
+            p -= np.outer(gain, px)
+        # keep P symmetric against rounding
+        self.p = (p + p.T) / 2
+        self.n += int(valid.sum())
+        self.history.append((stamp if stamp is not None else self.n, theta.copy()))
+        return self
+
+    @property
+    def coefficients(self):
+        return pd.Series(self.theta, index=self.labels)
+
+    def predict(self, x):
+        """Predictions with the current coefficients"""
+        return self._design(x) @ self.theta
+
+    def drift(self):
+        """Coefficients after each update, one row per update"""
+        stamps = [stamp for stamp, _ in self.history]
+        return pd.DataFrame([theta for _, theta in self.history], index=stamps, columns=self.labels)
+
+    def to_dict(self):
+        history = [[stamp.isoformat() if isinstance(stamp, pd.Timestamp) else stamp, theta.tolist()]
+                   for stamp, theta in self.history]
+        return {'names': self.names, 'forgetting': self.forgetting, 'intercept': self.intercept,
+                'delta': self.delta, 'max_history': self.history.maxlen, 'n': self.n,
+                'theta': self.theta.tolist(), 'p': self.p.tolist(), 'history': history}
+
+    @classmethod
+    def from_dict(cls, state):
+        model = cls(state['names'], state['forgetting'], state['intercept'], state['delta'], state['max_history'])
+        model.n = state['n']
+        model.theta = np.array(state['theta'])
+        model.p = np.array(state['p'])
+        for stamp, theta in state['history']:
+            model.history.append((pd.Timestamp(stamp) if isinstance(stamp, str) else stamp, np.array(theta)))
+        return model
+
+    def save(self, path):
+        """Checkpoint the state to a json file"""
+        with open(path, 'w') as handle:
+            json.dump(self.to_dict(), handle)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as handle:
+            return cls.from_dict(json.load(handle))
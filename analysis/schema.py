@@ -0,0 +1,147 @@
+"""
+Declarative schemas with one-pass coercion and a bad-token report.
+
+The car script finds the bad hp values by looking at the False rows of
+car_data.hp.str.isdigit(), then runs replace('?', np.nan) over every
+column and astype(float) after imputation, each a full copy. coerce
+converts every column of a schema straight to its final dtype in one
+vectorized pass and records, per column, how many values did not parse,
+which tokens they were and at which row positions.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from analysis.loader import DATETIME_COLUMN, DATETIME_FORMAT, DTYPES
+
+# '?' is deliberately not here: it is the car file's bad hp token and gets reported
+NA_TOKENS = ('', 'NA', 'NaN', 'nan')
+
+Column = namedtuple('Column', ['name', 'dtype', 'na_tokens', 'format', 'categories'],
+                    defaults=[NA_TOKENS, None, None])
+Column.__doc__ = """
+Expected column
+name: column name
+dtype: final dtype ('float64', 'int8', 'category', 'datetime64[ns]', 'str', ...)
+na_tokens: strings that mean missing and are not counted as bad
+format: strptime format of datetime columns
+categories: allowed categories of category columns (default any)
+"""
+
+CAR_SCHEMA = [Column('mpg', 'float64'), Column('cyl', 'int8'), Column('disp', 'float64'),
+              Column('hp', 'float64'), Column('wt', 'float64'), Column('acc', 'float64'),
+              Column('yr', 'int8'), Column('origin', 'int8'), Column('car_type', 'int8'),
+              Column('car_name', 'str')]
+
+UBER_SCHEMA = [Column(DATETIME_COLUMN, 'datetime64[ns]', format=DATETIME_FORMAT)] + \
+    [Column(name, dtype) for name, dtype in DTYPES.items()]
+
+
+class SchemaReport:
+    """
+    Per-column outcome of a coercion
+    columns: {name: {'dtype', 'bad', 'missing', 'tokens', 'rows'}}
+    absent: schema columns not in the data
+    unexpected: data columns not in the schema
+    """
+
+    def __init__(self):
+        self.columns = {}
+        self.absent = []
+        self.unexpected = []
+
+    @property
+    def ok(self):
+        return not self.absent and not any(col['bad'] for col in self.columns.values())
+
+    def summary(self):
+        """One row per column: final dtype, missing count, bad count and the bad tokens"""
+        return pd.DataFrame({name: {'dtype': col['dtype'], 'missing': col['missing'], 'bad': col['bad'],
+                                    'tokens': col['tokens']} for name, col in self.columns.items()}).T
+
+    def bad_rows(self, column):
+        """Row positions of the values of column that did not parse"""
+        return self.columns[column]['rows']
+
+
+def _is_text(series):
+    return series.dtype == object or pd.api.types.is_string_dtype(series.dtype)
+
+
+def _coerce(series, column):
+    """Converted series and a mask of values that did not parse"""
+    raw = series
+    if _is_text(raw):
+        stripped = raw.str.strip()
+        blank = stripped.isin(column.na_tokens)
+        raw = stripped.mask(blank)
+    elif isinstance(raw.dtype, pd.CategoricalDtype):
+        raw = raw.cat.remove_categories(raw.cat.categories.intersection(list(column.na_tokens)))
+    dtype = column.dtype
+    if dtype == 'category':
+        converted = raw.astype('category')
+        if column.categories is not None:
+            converted = converted.cat.set_categories(column.categories)
+    elif dtype.startswith('datetime'):
+        converted = pd.to_datetime(raw, format=column.format, errors='coerce').astype(dtype)
+    elif dtype == 'str':
+        return raw.astype('str').mask(raw.isna()), np.zeros(len(raw), dtype=bool)
+    else:
+        converted = pd.to_numeric(raw, errors='coerce') if _is_text(raw) else raw
+        if np.dtype(dtype).kind in 'iu':
+            # a fraction or a value the integer type cannot hold would be
+            # truncated or wrapped by astype; it is bad, not converted
+            values = converted.to_numpy(dtype=np.float64, na_value=np.nan)
+            limits = np.iinfo(dtype)
+            unfit = ~np.isnan(values) & ((values != np.floor(values)) | (values < limits.min) | (values > limits.max))
+            if unfit.any():
+                converted = converted.mask(unfit)
+            if converted.isna().any():
+                # an integer column with holes can only be float
+                dtype = 'float64'
+        converted = converted.astype(dtype)
+    bad = (converted.isna() & raw.notna()).to_numpy()
+    return converted, bad
+
+
+def coerce(df, schema):
+    """
+    Convert every schema column of df to its dtype, in place
+    df: dataframe as read (text or already typed columns)
+    schema: list of Column
+
+    Returns df and a SchemaReport. Values that do not parse become missing
+    and are listed in the report.
+    """
+    report = SchemaReport()
+    names = [column.name for column in schema]
+    report.unexpected = [name for name in df.columns if name not in names]
+    for column in schema:
+        if column.name not in df:
+            report.absent.append(column.name)
+            continue
+        raw = df[column.name]
+        converted, bad = _coerce(raw, column)
+        rows = np.flatnonzero(bad).astype(np.int32)
+        tokens = raw.iloc[rows].astype(str).str.strip().value_counts().to_dict() if len(rows) else {}
+        df[column.name] = converted
+        report.columns[column.name] = {'dtype': str(converted.dtype), 'bad': len(rows),
+                                       'missing': int(converted.isna().sum()), 'tokens': tokens, 'rows': rows}
+    return df, report
+
+
+def read_csv(path, schema, **kwargs):
+    """
+    Read a csv and coerce it to schema
+    path: csv file
+    schema: list of Column
+    kwargs: passed to pd.read_csv
+
+    Category and text columns are read as such; numeric and datetime
+    columns are read as strings and parsed once by coerce, so no token
+    such as '?' turns a column into object dtype.
+    """
+    dtypes = {column.name: 'category' if column.dtype == 'category' else 'str' for column in schema}
+    df = pd.read_csv(path, dtype=dtypes, keep_default_na=False, **kwargs)
+    return coerce(df, schema)
@@ -0,0 +1,205 @@
+"""
+Export and batch scoring of the linear mpg model.
+
+The regression only exists inside the notebook session. export_model
+writes a fitted analysis.ols.OLSResult (and the CategoricalEncoder its
+dummies came from) to a small binary file: a json header with the
+feature order, intercept and encoder state, followed by the float64
+coefficients. LinearModel memory-maps the coefficients and scores frames
+in fixed-size chunks with one matrix-vector product per chunk.
+
+    python -m analysis.scoring model.bin cars.csv predictions.csv
+    python -m analysis.scoring model.bin --serve 8000
+
+The first form streams the csv and prints rows/sec and per-batch
+latency; the second answers micro-batches on
+POST http://127.0.0.1:8000/predict with {"rows": [{...}, ...]}.
+"""
+import argparse
+import json
+import struct
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from analysis.encoding import CategoricalEncoder
+from analysis.profiling import profiled
+
+MAGIC = b'LINMODEL'
+VERSION = 1
+CHUNKSIZE = 65_536
+_PREFIX = struct.Struct('<8sII')
+
+
+def export_model(result, path, encoder=None, target=None):
+    """
+    Write a fitted model to path
+    result: analysis.ols.OLSResult
+    encoder: fitted CategoricalEncoder whose dummy columns are among the
+             regressors (default none)
+    target: name of the predicted column, kept for reference
+    """
+    coef = result.coef
+    header = {'version': VERSION, 'features': list(coef.index), 'intercept': float(result.intercept),
+              'target': target, 'encoder': encoder.to_dict() if encoder is not None else None}
+    raw = json.dumps(header).encode()
+    # pad so the coefficients start 8-byte aligned and can be memory-mapped
+    raw += b' ' * (-(_PREFIX.size + len(raw)) % 8)
+    with open(path, 'wb') as handle:
+        handle.write(_PREFIX.pack(MAGIC, VERSION, len(raw)))
+        handle.write(raw)
+        handle.write(coef.to_numpy(dtype='<f8').tobytes())
+
+
+class LinearModel:
+    """
+    Exported linear model, coefficients memory-mapped from disk
+    path: file written by export_model
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            magic, version, size = _PREFIX.unpack(handle.read(_PREFIX.size))
+            if magic != MAGIC:
+                raise ValueError("{} is not an exported model".format(path))
+            if version > VERSION:
+                raise ValueError("model format {} is newer than this reader ({})".format(version, VERSION))
+            header = json.loads(handle.read(size))
+        self.features = header['features']
+        self.intercept = header['intercept']
+        self.target = header['target']
+        self.encoder = CategoricalEncoder.from_dict(header['encoder']) if header['encoder'] else None
+        self.coef = np.memmap(path, dtype='<f8', mode='r', offset=_PREFIX.size + size, shape=(len(self.features),))
+        encoded = set(self.encoder.feature_names) if self.encoder is not None else set()
+        self._numeric = [name for name in self.features if name not in encoded]
+        # design columns are numeric first, then the encoder block
+        order = self._numeric + (self.encoder.feature_names if self.encoder is not None else [])
+        position = {name: i for i, name in enumerate(self.features)}
+        self._weights = np.array([self.coef[position[name]] if name in position else 0.0 for name in order])
+
+    def design(self, df):
+        """Design matrix of df in the model's column order"""
+        x = df[self._numeric].to_numpy(dtype=np.float64)
+        if self.encoder is not None:
+            x = np.hstack([x, self.encoder.transform(df)])
+        return x
+
+    @profiled('predict')
+    def predict(self, df):
+        """Predictions for one frame"""
+        return self.design(df) @ self._weights + self.intercept
+
+    def score_chunks(self, chunks, stats=None):
+        """
+        Yield predictions chunk by chunk
+        chunks: iterable of frames (e.g. pd.read_csv(..., chunksize=N))
+        stats: optional BatchStats to record rows and latency in
+        """
+        for chunk in chunks:
+            start = time.perf_counter()
+            predictions = self.predict(chunk)
+            if stats is not None:
+                stats.add(len(chunk), time.perf_counter() - start)
+            yield chunk.index, predictions
+
+
+class BatchStats:
+    """Rows and latency of scored batches"""
+
+    def __init__(self):
+        self.rows = 0
+        self.latencies = []
+
+    def add(self, rows, seconds):
+        self.rows += rows
+        self.latencies.append(seconds)
+
+    def summary(self):
+        latencies = np.array(self.latencies or [0.0])
+        total = latencies.sum()
+        return {'rows': self.rows, 'batches': len(self.latencies),
+                'rows_per_sec': self.rows / total if total else float('nan'),
+                'latency_ms_p50': np.percentile(latencies, 50) * 1e3,
+                'latency_ms_p95': np.percentile(latencies, 95) * 1e3,
+                'latency_ms_max': latencies.max() * 1e3}
+
+
+def score_csv(model, source, destination, chunksize=CHUNKSIZE):
+    """
+    Score a csv into another csv with a single prediction column
+    model: LinearModel
+    source, destination: csv paths
+    chunksize: rows per batch (default CHUNKSIZE)
+    """
+    stats = BatchStats()
+    name = model.target or 'prediction'
+    with pd.read_csv(source, chunksize=chunksize) as reader, open(destination, 'w') as out:
+        out.write(name + '\n')
+        for _, predictions in model.score_chunks(reader, stats):
+            np.savetxt(out, predictions, fmt='%.10g')
+    return stats
+
+
+def make_handler(model):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != '/predict':
+                self.send_error(404)
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                predictions = model.predict(pd.DataFrame(body['rows'])).tolist()
+            except (ValueError, KeyError, TypeError) as error:
+                self.send_error(400, str(error))
+                return
+            payload = json.dumps({'predictions': predictions}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(model, port, host='127.0.0.1'):
+    """Answer POST /predict micro-batches until interrupted"""
+    server = ThreadingHTTPServer((host, port), make_handler(model))
+    print("serving {} on http://{}:{}/predict".format(model.target or 'model', host, server.server_port),
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="batch scoring of an exported linear model")
+    parser.add_argument('model')
+    parser.add_argument('source', nargs='?')
+    parser.add_argument('destination', nargs='?')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE)
+    parser.add_argument('--serve', type=int, metavar='PORT')
+    args = parser.parse_args(argv)
+    model = LinearModel(args.model)
+    if args.serve is not None:
+        serve(model, args.serve)
+        return
+    if not (args.source and args.destination):
+        parser.error("source and destination are required unless --serve is given")
+    summary = score_csv(model, args.source, args.destination, args.chunksize).summary()
+    print("{rows} rows in {batches} batches, {rows_per_sec:,.0f} rows/sec, batch latency p50 "
+          "{latency_ms_p50:.2f} ms, p95 {latency_ms_p95:.2f} ms, max {latency_ms_max:.2f} ms".format(**summary),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Key-sharded parallel runs over the cleaned pickup frame.
+
+The notebook runs every step over one frame although most of them
+(groupby(['borough','hday']), per-borough hourly lines,
+catplot(col='borough')) are independent per borough. ShardedRunner
+splits the frame by a key column into uncompressed Arrow IPC files, the
+format of analysis.cache, and every worker of a process pool
+memory-maps its own shard instead of receiving a pickled copy. Results
+come back per shard and are merged:
+
+- frames and series are concatenated, with the shard as an outer index
+  level unless the key is already one of their columns (exact when the
+  grouping includes the key, as per-borough roll-ups do);
+- objects with a merge() method (PickupCube, OLSAccumulator,
+  CorrelationAccumulator, KLLSketch, ...) are merged into one;
+- anything else comes back as {shard: result}.
+
+A stage is a module-level function called as stage(frame, shard, *args),
+so it can be sent to another process.
+"""
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from analysis.cache import pa, read_frame, write_frame
+from analysis.cube import PickupCube
+from analysis.impute import Imputer
+from analysis.plots import aggregate, lineplot
+
+
+def _run(task):
+    stage, shard, path, columns, args = task
+    return stage(read_frame(path, columns), shard, *args)
+
+
+def _impute(task):
+    shard, path, state = task
+    df = read_frame(path)
+    before = df.isna().sum()
+    write_frame(Imputer.from_dict(state).transform(df), path)
+    return before - df.isna().sum()
+
+
+def merge_results(results, key=None):
+    """
+    Merge per-shard results
+    results: {shard: result}
+    key: name of the level holding the shard in concatenated frames
+    """
+    values = list(results.values())
+    if not values:
+        return results
+    if all(isinstance(value, (pd.DataFrame, pd.Series)) for value in values):
+        if key is not None and all(key in getattr(value, 'columns', ()) for value in values):
+            return pd.concat(values, ignore_index=True)
+        return pd.concat(results, names=[key])
+    if all(hasattr(value, 'merge') for value in values):
+        merged = values[0]
+        for value in values[1:]:
+            merged.merge(value)
+        return merged
+    return results
+
+
+class ShardedRunner:
+    """
+    Process pool over per-key shards of a frame
+    df: cleaned pickup frame (or any frame)
+    key: column to shard by (default 'borough'); missing values form their
+         own shard, labelled None, so fill the key before sharding
+    directory: where the shard files go (default a temporary directory,
+               removed by close())
+    workers: processes (default os.cpu_count(); 1 runs in this process)
+
+    Use it as a context manager, or call close() when done.
+    """
+
+    def __init__(self, df, key='borough', directory=None, workers=None):
+        if pa is None:
+            raise ImportError("ShardedRunner needs pyarrow")
+        self.key = key
+        self._pool = None
+        self.workers = workers or os.cpu_count() or 1
+        self._owned = directory is None
+        self.directory = tempfile.mkdtemp(prefix='shards-') if directory is None else directory
+        os.makedirs(self.directory, exist_ok=True)
+        codes, labels = pd.factorize(df[key], sort=True, use_na_sentinel=False)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+        self.shards = {}
+        for i, label in enumerate(labels):
+            label = None if pd.isna(label) else label
+            path = os.path.join(self.directory, 'shard-{}.arrow'.format(i))
+            write_frame(df.iloc[order[bounds[i]:bounds[i + 1]]], path)
+            self.shards[label] = path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Stop the workers and remove the shard files if the runner made their directory"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._owned and os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+    def read(self, shard, columns=None):
+        """One shard, memory-mapped"""
+        return read_frame(self.shards[shard], columns)
+
+    def read_all(self, columns=None):
+        """All shards concatenated"""
+        return pd.concat([read_frame(path, columns) for path in self.shards.values()], ignore_index=True)
+
+    def _map(self, func, tasks):
+        if self.workers == 1 or len(tasks) == 1:
+            return [func(task) for task in tasks]
+        if self._pool is None:
+            # kept for the runner's lifetime, stages reuse warm workers
+            self._pool = ProcessPoolExecutor(max_workers=min(self.workers, len(self.shards)))
+        return list(self._pool.map(func, tasks))
+
+    def map(self, stage, *args, columns=None):
+        """
+        Run stage(frame, shard, *args) on every shard
+        columns: columns to read (default all)
+        Returns {shard: result}.
+        """
+        tasks = [(stage, shard, path, columns, args) for shard, path in self.shards.items()]
+        return dict(zip(self.shards, self._map(_run, tasks)))
+
+    def run(self, stage, *args, columns=None):
+        """map() followed by merge_results()"""
+        return merge_results(self.map(stage, *args, columns=columns), self.key)
+
+    def impute(self, imputer):
+        """
+        Fill the shards in place
+        imputer: Imputer, fitted here on all shards when it is not fitted yet
+
+        A fill statistic can depend on other shards (the notebook fills
+        temp everywhere with the Brooklyn mean), so it is fitted once on
+        the columns it needs and only transform runs per shard. Returns
+        the number of filled values per column and shard.
+        """
+        if not imputer.fills:
+            needed = set(imputer.rules)
+            for rule in imputer.rules.values():
+                needed.update(rule['by'], rule['where'])
+            imputer.fit(self.read_all(sorted(needed)))
+        state = imputer.to_dict()
+        tasks = [(shard, path, state) for shard, path in self.shards.items()]
+        return pd.DataFrame(dict(zip(self.shards, self._map(_impute, tasks)))).T
+
+
+def cube_stage(frame, shard):
+    """PickupCube of one shard; the shards merge into the full cube"""
+    return PickupCube().update(frame)
+
+
+def aggregate_stage(frame, shard, by, y='pickups', estimator='sum'):
+    """analysis.plots.aggregate of one shard, exact after merging when by includes the key"""
+    return aggregate(frame, by, y, estimator)
+
+
+def plot_stage(frame, shard, directory, x='start_hour', hue='hday', y='pickups', estimator='mean'):
+    """
+    Save a line plot of one shard as <directory>/<shard>.png
+    Returns the file path.
+    """
+    from matplotlib.figure import Figure
+
+    # a bare Figure needs no pyplot state and renders without a display
+    figure = Figure(figsize=(8, 4))
+    ax = figure.subplots()
+    lineplot(frame, x, y, hue=hue, estimator=estimator, ax=ax)
+    ax.set_title(str(shard))
+    path = os.path.join(directory, '{}.png'.format(str(shard).replace(os.sep, '_').replace(' ', '_')))
+    figure.savefig(path)
+    return path
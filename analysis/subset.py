@@ -0,0 +1,233 @@
+"""
+Exhaustive and stepwise feature-subset search for OLS.
+
+The car script drops the origin dummies by hand and hard-codes the
+formula 'mpg ~ cyl+disp++hp+wt+acc+yr+car_type'. The search here scores
+candidate subsets from the Gram matrix of an OLSAccumulator and never
+refits. Sweeping a regressor into the Gram matrix turns its yy entry into
+the RSS of the current subset. Sweeping it back out restores the matrix.
+Each step therefore costs O(p^2):
+
+- exhaustive walks all 2^p subsets in Gray-code order, so every step
+  adds or removes exactly one regressor;
+- stepwise adds (forward) or drops (backward) the regressor that changes
+  the RSS most, and stops when the criterion stops improving.
+
+A regressor whose pivot vanishes is collinear with the subset, e.g. the
+third origin dummy next to the other two and an intercept. Subsets
+holding one are left out of the ranking.
+"""
+import numpy as np
+import pandas as pd
+
+CRITERIA = ('rsquared_adj', 'aic', 'bic')
+MAX_EXHAUSTIVE = 24
+TOLERANCE = 1e-10
+# rebuild the swept matrix from scratch this often to shed rounding
+REFRESH = 1024
+
+
+def _sweep(a, k, inverse=False):
+    """Sweep (or with inverse, unsweep) pivot k of the symmetric matrix a, in place"""
+    d = a[k, k]
+    col = a[:, k].copy()
+    a -= np.outer(col, col) / d
+    col *= (-1.0 if inverse else 1.0) / d
+    a[:, k] = col
+    a[k, :] = col
+    a[k, k] = -1.0 / d
+
+
+def criteria(rss, size, n, tss, intercept=True):
+    """
+    R^2, adjusted R^2, AIC and BIC as statsmodels reports them
+    rss: residual sums of squares
+    size: number of regressors in each subset, intercept excluded
+    n: number of rows
+    tss: total sum of squares (centered when intercept)
+    """
+    rss = np.asarray(rss, dtype=np.float64)
+    k = np.asarray(size) + (1 if intercept else 0)
+    rsquared = 1.0 - rss / tss
+    with np.errstate(divide='ignore', invalid='ignore'):
+        adjusted = 1.0 - (1.0 - rsquared) * (n - (1 if intercept else 0)) / (n - k)
+        deviance = n * np.log(rss / n) + n * (1.0 + np.log(2 * np.pi))
+    return {'rss': rss, 'rsquared': rsquared, 'rsquared_adj': adjusted,
+            'aic': deviance + 2 * k, 'bic': deviance + k * np.log(n)}
+
+
+class _Swept:
+    """Gram matrix of an accumulator with the intercept swept in"""
+
+    def __init__(self, accumulator, names):
+        if accumulator.gram is None:
+            raise ValueError("no rows accumulated")
+        names = list(names) if names is not None else list(accumulator.names)
+        idx = [0] + [accumulator.names.index(name) + 1 for name in names] + [len(accumulator.names) + 1]
+        self.base = accumulator.gram[np.ix_(idx, idx)].copy()
+        self.names = names
+        self.intercept = accumulator.intercept
+        self.n = accumulator.gram[0, 0]
+        self.y = len(idx) - 1
+        if self.intercept:
+            _sweep(self.base, 0)
+        # scale of each regressor once the intercept is out, for the collinearity test
+        self.scale = np.diag(self.base).copy()
+        self.tss = self.base[-1, -1]
+        self.reset()
+
+    def reset(self, members=()):
+        self.a = self.base.copy()
+        self.swept = np.zeros(len(self.base), dtype=bool)
+        self.skipped = set()
+        for j in members:
+            self.add(j)
+
+    def pivot_ok(self, j):
+        return self.a[j, j] > TOLERANCE * self.scale[j]
+
+    def add(self, j):
+        if self.pivot_ok(j):
+            _sweep(self.a, j)
+            self.swept[j] = True
+        else:
+            self.skipped.add(j)
+
+    def remove(self, j):
+        if j in self.skipped:
+            self.skipped.discard(j)
+            return
+        _sweep(self.a, j, inverse=True)
+        self.swept[j] = False
+        if self.skipped:
+            # a skipped regressor may not be collinear with what is left
+            self.reset(sorted(self.skipped | set(np.flatnonzero(self.swept))))
+
+    @property
+    def rss(self):
+        return np.nan if self.skipped else max(self.a[self.y, self.y], 0.0)
+
+    def members(self):
+        return sorted(set(np.flatnonzero(self.swept)) | self.skipped)
+
+    def label(self, members):
+        return '+'.join(self.names[j - 1] for j in members)
+
+
+def _table(swept, rss, size, features):
+    table = pd.DataFrame({'features': features, 'size': size})
+    for key, value in criteria(rss, size, swept.n, swept.tss, swept.intercept).items():
+        table[key] = value
+    return table
+
+
+def _check(by):
+    if by not in CRITERIA:
+        raise ValueError("by must be one of {}, got {}".format(CRITERIA, by))
+
+
+def _order(table, by):
+    _check(by)
+    return table.sort_values(by, ascending=by != 'rsquared_adj', kind='stable')
+
+
+def exhaustive(accumulator, names=None, by='bic', top=20, max_features=MAX_EXHAUSTIVE):
+    """
+    Score every subset of the regressors
+    accumulator: OLSAccumulator holding the data
+    names: regressors to search over (default all of the accumulator's)
+    by: 'rsquared_adj', 'aic' or 'bic' (default 'bic')
+    top: number of best subsets to return (default 20, None for all)
+    max_features: refuse larger searches, 2^p grows fast (default MAX_EXHAUSTIVE)
+
+    Returns the best subsets, best first, with features joined by '+'
+    as in a formula, size, rss, rsquared, rsquared_adj, aic and bic.
+    """
+    swept = _Swept(accumulator, names)
+    p = len(swept.names)
+    if p > max_features:
+        raise ValueError("{} regressors give 2^{} subsets, use stepwise or raise max_features".format(p, p))
+    total = 1 << p
+    masks = np.zeros(total, dtype=np.int64)
+    rss = np.empty(total)
+    rss[0] = swept.rss
+    mask = 0
+    for step in range(1, total):
+        # the Gray code of step differs from the previous one in its lowest set bit
+        bit = (step & -step).bit_length() - 1
+        mask ^= 1 << bit
+        if step % REFRESH == 0:
+            swept.reset([j + 1 for j in range(p) if mask >> j & 1])
+        elif mask >> bit & 1:
+            swept.add(bit + 1)
+        else:
+            swept.remove(bit + 1)
+        masks[step] = mask
+        rss[step] = swept.rss
+    size = sum((masks >> j) & 1 for j in range(p))
+    keep = ~np.isnan(rss)
+    table = _table(swept, rss[keep], size[keep], masks[keep])
+    table = _order(table, by)
+    if top is not None:
+        table = table.head(top)
+    table['features'] = [swept.label([j + 1 for j in range(p) if m >> j & 1]) for m in table['features']]
+    return table.reset_index(drop=True)
+
+
+def stepwise(accumulator, names=None, direction='forward', by='bic'):
+    """
+    Forward or backward stepwise selection
+    accumulator: OLSAccumulator holding the data
+    names: candidate regressors (default all of the accumulator's)
+    direction: 'forward' starts empty and adds, 'backward' starts full and drops
+    by: criterion that has to improve for a step to be taken (default 'bic')
+
+    Returns the path, one row per step with the regressor added or
+    dropped and the statistics of the subset after it. The last row is
+    the selected subset.
+    """
+    if direction not in ('forward', 'backward'):
+        raise ValueError("direction must be 'forward' or 'backward', got {}".format(direction))
+    _check(by)
+    swept = _Swept(accumulator, names)
+    p = len(swept.names)
+    better = (lambda new, old: new > old) if by == 'rsquared_adj' else (lambda new, old: new < old)
+    path = []
+
+    def record(action):
+        members = [j for j in swept.members() if j not in swept.skipped]
+        path.append((action, swept.label(members), len(members), swept.rss))
+
+    if direction == 'forward':
+        record('')
+    else:
+        swept.reset(range(1, p + 1))
+        # collinear with the rest, these cannot improve any fit
+        swept.skipped.clear()
+        record('')
+
+    while True:
+        a, y = swept.a, swept.y
+        if direction == 'forward':
+            candidates = [j for j in range(1, p + 1) if not swept.swept[j] and swept.pivot_ok(j)]
+            change = [-a[j, y] ** 2 / a[j, j] for j in candidates]
+        else:
+            candidates = list(np.flatnonzero(swept.swept[1:y]) + 1)
+            change = [a[j, y] ** 2 / -a[j, j] for j in candidates]
+        if not candidates:
+            break
+        j = candidates[int(np.argmin(change))]
+        size = path[-1][2] + (1 if direction == 'forward' else -1)
+        current = criteria(path[-1][3], path[-1][2], swept.n, swept.tss, swept.intercept)[by]
+        proposed = criteria(path[-1][3] + min(change), size, swept.n, swept.tss, swept.intercept)[by]
+        if not better(proposed, current):
+            break
+        if direction == 'forward':
+            swept.add(j)
+        else:
+            swept.remove(j)
+        record(('+' if direction == 'forward' else '-') + swept.names[j - 1])
+
+    table = _table(swept, [row[3] for row in path], [row[2] for row in path], [row[1] for row in path])
+    table.insert(0, 'step', [row[0] for row in path])
+    return table
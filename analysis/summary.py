@@ -0,0 +1,124 @@
+"""
+Box and histogram statistics for many numeric columns at once.
+
+histogram_boxplot is called once per column and lets seaborn sort the
+raw column twice (box and histogram) plus separate mean() and median()
+calls. feature_summaries computes quartiles, whiskers, outliers, bin
+edges and counts for a list of columns together, from a frame or from a
+chunked source that never has to fit in memory (two streaming passes).
+"""
+import math
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from analysis.sketch import DEFAULT_K, ColumnSketches
+
+
+def _chunks(source):
+    """Callable returning a fresh iterator of frames over source"""
+    if isinstance(source, pd.DataFrame):
+        return lambda: iter([source])
+    if callable(source):
+        return source
+    if isinstance(source, (list, tuple)):
+        return lambda: iter(source)
+    raise TypeError("source must be a dataframe, a list of frames or a callable returning an iterator of frames")
+
+
+def auto_bins(count, low, high, iqr, integer=False):
+    """Number of bins numpy's 'auto' rule picks, from summary values only"""
+    if count == 0 or not high > low:
+        return 1
+    sturges = (high - low) / (math.log2(count) + 1.0)
+    fd = 2.0 * iqr * count ** (-1.0 / 3.0)
+    width = min(fd, sturges) if fd > 0 else sturges
+    if integer:
+        width = max(width, 1.0)  # no empty bins between integer values
+    return max(int(math.ceil((high - low) / width)), 1)
+
+
+def _values(chunk, features):
+    return chunk[features].to_numpy(dtype=np.float64)
+
+
+def feature_summaries(source, features, bins=None, whis=1.5, sketch_k=DEFAULT_K):
+    """
+    Box and histogram statistics of every feature
+    source: dataframe, list of frames, or a callable returning an iterator
+            of frames (e.g. lambda: read_pickups(path))
+    features: list of numeric column names
+    bins: number of histogram bins (default numpy's 'auto' rule)
+    whis: whisker length in IQRs (default 1.5)
+    sketch_k: accuracy of the quantile sketches used for chunked sources (default 200)
+
+    Returns {feature: {count, mean, q1, med, q3, iqr, whislo, whishi,
+    fliers, edges, counts}}, the box values named as matplotlib's bxp
+    expects them. Quartiles are exact for a dataframe; for chunked sources
+    they come from analysis.sketch.ColumnSketches built in the first pass
+    (see there for the error bound). Whiskers, fliers and counts are exact
+    given the quartiles.
+    """
+    features = list(features)
+    k = len(features)
+    chunks = _chunks(source)
+    in_memory = isinstance(source, pd.DataFrame)
+
+    # pass 1: count, sum, min, max (and quantile sketches)
+    count = np.zeros(k, dtype=np.int64)
+    total = np.zeros(k)
+    low = np.full(k, np.inf)
+    high = np.full(k, -np.inf)
+    integer = np.ones(k, dtype=bool)
+    sketches = None if in_memory else ColumnSketches(features, k=sketch_k)
+    for chunk in chunks():
+        if sketches is not None:
+            sketches.update(chunk)
+        integer &= np.array([dtype.kind in 'iu' for dtype in chunk[features].dtypes])
+        values = _values(chunk, features)
+        valid = ~np.isnan(values)
+        count += valid.sum(axis=0)
+        total += np.where(valid, values, 0).sum(axis=0)
+        low = np.fmin(low, np.nanmin(values, axis=0, initial=np.inf))
+        high = np.fmax(high, np.nanmax(values, axis=0, initial=-np.inf))
+
+    # quartiles
+    if in_memory:
+        values = _values(source, features)
+        quartiles = np.full((3, k), np.nan)
+        if len(values):
+            with np.errstate(invalid='ignore'), warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN columns stay NaN
+                quartiles = np.nanquantile(values, [0.25, 0.5, 0.75], axis=0)
+    else:
+        quartiles = sketches.quantiles([0.25, 0.5, 0.75]).to_numpy()
+    q1, med, q3 = quartiles
+    iqr = q3 - q1
+    lo_fence, hi_fence = q1 - whis * iqr, q3 + whis * iqr
+
+    # pass 2: whisker ends, outliers and the display histogram
+    nbins = [bins or auto_bins(count[i], low[i], high[i], iqr[i], integer[i]) for i in range(k)]
+    edges = [np.linspace(low[i], high[i], nbins[i] + 1) if count[i] else np.array([0.0, 1.0]) for i in range(k)]
+    counts = [np.zeros(nbins[i], dtype=np.int64) for i in range(k)]
+    whislo = np.full(k, np.inf)
+    whishi = np.full(k, -np.inf)
+    fliers = [set() for _ in range(k)]
+    for chunk in chunks():
+        values = _values(chunk, features)
+        inside = (values >= lo_fence) & (values <= hi_fence)
+        whislo = np.fmin(whislo, np.where(inside, values, np.inf).min(axis=0, initial=np.inf))
+        whishi = np.fmax(whishi, np.where(inside, values, -np.inf).max(axis=0, initial=-np.inf))
+        outside = ~inside & ~np.isnan(values)
+        for i in range(k):
+            column = values[:, i]
+            # distinct values are enough to draw the flier markers
+            fliers[i].update(np.unique(column[outside[:, i]]).tolist())
+            counts[i] += np.histogram(column[~np.isnan(column)], bins=edges[i])[0]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    return {feature: {'count': int(count[i]), 'mean': mean[i], 'q1': q1[i], 'med': med[i], 'q3': q3[i],
+                      'iqr': iqr[i], 'whislo': whislo[i], 'whishi': whishi[i],
+                      'fliers': np.array(sorted(fliers[i])), 'edges': edges[i], 'counts': counts[i]}
+            for i, feature in enumerate(features)}
@@ -0,0 +1,231 @@
+"""
+Synthetic pickups with the schema of Uber_Data new.csv.
+
+The real file has 29,101 rows, too few to show how any step scales.
+synthetic_pickups() and write_csv() draw any number of rows, 1M to 100M
+and beyond, that look like it:
+
+- one weather record per hour, shared by every row of that hour: a
+  seasonal and daily temperature cycle with AR(1) noise, dew point under
+  it, wind, pressure, rain spells summed into pcp01/pcp06/pcp24, snow
+  depth that builds on cold wet hours and melts, visibility that drops
+  in rain and fog;
+- pickups per borough scaled by an hour-of-week profile (quiet early
+  mornings, busy evenings, late Friday and Saturday nights), monthly
+  growth, holidays and an hourly demand shock, with gamma-Poisson noise,
+  so counts are skewed and Manhattan dwarfs Staten Island and EWR;
+- borough missing on about a tenth of the rows (with the handful of
+  pickups those rows have in the real file) and a run of days with no
+  temp at all, as in the real file.
+
+Rows are draws over the hours of a fixed window (January to June 2015 by
+default, the months the notebook plots), sorted by hour and borough. At
+large sizes hours repeat rather than the window growing, so calendar
+parts and group sizes keep the cardinalities of the real file.
+
+Data is generated chunk by chunk; write_csv() needs memory for one chunk
+at any size. The same rows, seed and chunksize give the same data.
+
+    python -m analysis.synthetic pickups.csv --rows 10000000
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import USFederalHolidayCalendar
+
+from analysis.loader import CATEGORY_COLUMNS, COLUMNS, DATETIME_COLUMN, DATETIME_FORMAT, DTYPES, WEATHER_COLUMNS
+
+START = '2015-01-01'
+DAYS = 181
+CHUNKSIZE = 1_000_000
+
+BOROUGHS = ['Bronx', 'Brooklyn', 'EWR', 'Manhattan', 'Queens', 'Staten Island']
+MISSING_BOROUGH = 0.105
+TEMP_GAP = 0.1
+# mean pickups of a row per borough in the real file, the last for a missing borough
+LEVELS = np.array([50.0, 534.0, 0.02, 2387.0, 309.0, 1.6, 2.6])
+# gamma shape of the demand noise, smaller is more skewed
+SHAPE = 4.0
+
+_DAY = np.array([0.95, 0.75, 0.55, 0.40, 0.30, 0.30, 0.50, 0.80, 0.95, 0.95, 0.90, 0.92,
+                 0.95, 0.95, 1.00, 1.00, 0.95, 1.10, 1.30, 1.40, 1.35, 1.35, 1.35, 1.20])
+
+
+def week_profile():
+    """Demand multiplier per (weekday, hour), Monday first"""
+    profile = np.tile(_DAY, (7, 1))
+    profile[0, :4] *= 0.8            # Sunday night is quiet
+    profile[5:, :4] *= 1.6           # Friday and Saturday nights run late
+    profile[5:, 6:10] *= 0.5         # weekend mornings start slowly
+    profile[4:6, 20:] *= 1.15        # Friday and Saturday evenings
+    return profile / profile.mean()
+
+
+def _ar1(rng, size, phi, sd):
+    """AR(1) series with stationary standard deviation sd"""
+    shocks = rng.normal(0, sd * np.sqrt(1 - phi ** 2), size)
+    shocks[0] = rng.normal(0, sd)
+    values = np.empty(size)
+    level = 0.0
+    for i, shock in enumerate(shocks):
+        level = phi * level + shock
+        values[i] = level
+    return values
+
+
+def _trailing_sum(values, window):
+    total = np.cumsum(np.concatenate([[0.0], values]))
+    return total[1:] - total[np.maximum(np.arange(1, len(values) + 1) - window, 0)]
+
+
+def hourly_weather(stamps, rng, temp_gap=TEMP_GAP):
+    """
+    One weather record per hour
+    stamps: DatetimeIndex of consecutive hours
+    rng: numpy Generator
+    temp_gap: share of the hours, one block of whole days, with no temp
+    """
+    hours = len(stamps)
+    season = -np.cos(2 * np.pi * (stamps.dayofyear.to_numpy() - 20) / 365.25)
+    daily = np.sin(2 * np.pi * (stamps.hour.to_numpy() - 9) / 24)
+    temp = 55 + 22 * season + 5 * daily + _ar1(rng, hours, 0.98, 7)
+    dewp = temp - rng.gamma(2.0, 4.0, hours)
+    wet = _ar1(rng, hours, 0.9, 1) > 1.4
+    pcp01 = np.where(wet, rng.exponential(0.04, hours), 0.0).round(2)
+    depth = np.empty(hours)
+    snow = 0.0
+    for i in range(hours):
+        if temp[i] < 33:
+            snow += pcp01[i] * 10
+        else:
+            snow = max(0.0, snow - 0.02 * (temp[i] - 32))
+        depth[i] = snow
+    fog = np.where(temp - dewp < 2, 3.0, 0.0)
+    weather = pd.DataFrame({
+        'spd': rng.gamma(3.0, 2.2, hours).round(1),
+        'vsb': np.clip(10 - np.minimum(9.5, pcp01 * 60) - fog, 0.1, 10).round(1),
+        'temp': temp.round(1),
+        'dewp': dewp.round(1),
+        'slp': (1017 + _ar1(rng, hours, 0.995, 7)).round(1),
+        'pcp01': pcp01,
+        'pcp06': _trailing_sum(pcp01, 6).round(2),
+        'pcp24': _trailing_sum(pcp01, 24).round(2),
+        'sd': depth.round(1),
+    }, index=stamps)
+    if temp_gap:
+        days = stamps.normalize().unique()
+        first = int(len(days) * 0.55)
+        gap = days[first:first + max(1, round(len(days) * temp_gap))]
+        weather.loc[stamps.normalize().isin(gap), 'temp'] = np.nan
+    return weather[WEATHER_COLUMNS]
+
+
+def _hours(start, days, rng, temp_gap):
+    """Per-hour stamps, weather, holiday flags and expected demand of the window"""
+    stamps = pd.date_range(start, periods=days * 24, freq='h')
+    weather = hourly_weather(stamps, rng, temp_gap)
+    dates = stamps.normalize()
+    holidays = USFederalHolidayCalendar().holidays(dates.min(), dates.max())
+    holiday = dates.isin(holidays)
+    months = (stamps.year - stamps[0].year) * 12 + stamps.month - stamps[0].month
+    demand = (week_profile()[stamps.dayofweek.to_numpy(), stamps.hour.to_numpy()]
+              * (1 + 0.04 * months.to_numpy())
+              * np.where(holiday, 0.8, 1.0)
+              * np.where(weather['pcp01'].to_numpy() > 0, 1.1, 1.0)
+              * rng.lognormal(0, 0.1, len(stamps)))
+    return stamps, weather, np.asarray(holiday), demand
+
+
+def _chunks(rows, seed, start, days, chunksize, temp_gap, missing_borough):
+    """Yield (window stamps, hour index per row, frame without pickup_dt) chunks of whole hours"""
+    if rows < 0:
+        raise ValueError("rows must not be negative")
+    rng = np.random.default_rng(seed)
+    stamps, weather, holiday, demand = _hours(start, days, rng, temp_gap)
+    counts = rng.multinomial(rows, np.full(len(stamps), 1 / len(stamps)))
+    bounds = np.searchsorted(np.cumsum(counts), np.arange(chunksize, rows, chunksize), side='right')
+    share = np.append(np.full(len(BOROUGHS), (1 - missing_borough) / len(BOROUGHS)), missing_borough)
+    values = weather.to_numpy(dtype=np.float32)
+    for first, last in zip(np.concatenate([[0], bounds]), np.append(bounds, len(stamps))):
+        hour = np.repeat(np.arange(first, last), counts[first:last])
+        if not len(hour):
+            continue
+        borough = rng.choice(len(share), len(hour), p=share)
+        order = np.lexsort((borough, hour))
+        hour, borough = hour[order], borough[order]
+        mean = LEVELS[borough] * demand[hour] * rng.gamma(SHAPE, 1 / SHAPE, len(hour))
+        frame = pd.DataFrame({
+            'borough': pd.Categorical.from_codes(np.where(borough < len(BOROUGHS), borough, -1), BOROUGHS),
+            'pickups': rng.poisson(mean).astype(DTYPES['pickups']),
+        })
+        for i, col in enumerate(WEATHER_COLUMNS):
+            frame[col] = values[hour, i]
+        frame['hday'] = pd.Categorical.from_codes(holiday[hour].astype(np.int8), ['N', 'Y'])
+        yield stamps, hour, frame
+
+
+def iter_pickups(rows, seed=0, start=START, days=DAYS, chunksize=CHUNKSIZE, temp_gap=TEMP_GAP,
+                 missing_borough=MISSING_BOROUGH):
+    """
+    Yield synthetic pickups as typed frames, like analysis.loader.read_pickups
+    rows: total number of rows
+    seed: random seed (default 0)
+    start, days: window the hours are drawn from (default 181 days from 2015-01-01)
+    chunksize: approximate rows per frame; chunks hold whole hours
+    temp_gap: share of the days with no temp (default 0.1, 0 for none)
+    missing_borough: share of rows with no borough (default 0.105)
+    """
+    for stamps, hour, frame in _chunks(rows, seed, start, days, chunksize, temp_gap, missing_borough):
+        frame.insert(0, DATETIME_COLUMN, stamps[hour])
+        yield frame[COLUMNS]
+
+
+def synthetic_pickups(rows, seed=0, **kwargs):
+    """
+    Synthetic pickups as one typed frame (see iter_pickups for the arguments)
+    """
+    frames = list(iter_pickups(rows, seed, **kwargs))
+    if not frames:
+        return pd.DataFrame({col: pd.Series(dtype=DTYPES.get(col, 'datetime64[ns]')) for col in COLUMNS})
+    frame = pd.concat(frames, ignore_index=True)
+    for col in CATEGORY_COLUMNS:
+        frame[col] = frame[col].astype(frames[0][col].dtype)
+    return frame
+
+
+def write_csv(path, rows, seed=0, start=START, days=DAYS, chunksize=CHUNKSIZE, temp_gap=TEMP_GAP,
+              missing_borough=MISSING_BOROUGH):
+    """
+    Write synthetic pickups to a csv laid out like Uber_Data new.csv
+    path: output file
+    rows, seed, start, days, chunksize, temp_gap, missing_borough: as for iter_pickups
+    """
+    labels = None
+    with open(path, 'w', newline='') as handle:
+        handle.write(','.join(COLUMNS) + '\n')
+        for stamps, hour, frame in _chunks(rows, seed, start, days, chunksize, temp_gap, missing_borough):
+            if labels is None:
+                # formatting the window's hours once is far cheaper than per row
+                labels = np.asarray(stamps.strftime(DATETIME_FORMAT), dtype=object)
+            frame.insert(0, DATETIME_COLUMN, labels[hour])
+            frame[COLUMNS].to_csv(handle, header=False, index=False)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="write synthetic pickups with the columns of Uber_Data new.csv")
+    parser.add_argument('path')
+    parser.add_argument('--rows', type=int, default=CHUNKSIZE)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start', default=START)
+    parser.add_argument('--days', type=int, default=DAYS)
+    parser.add_argument('--temp-gap', type=float, default=TEMP_GAP)
+    parser.add_argument('--missing-borough', type=float, default=MISSING_BOROUGH)
+    args = parser.parse_args(argv)
+    write_csv(args.path, args.rows, args.seed, args.start, args.days, temp_gap=args.temp_gap,
+              missing_borough=args.missing_borough)
+
+
+if __name__ == '__main__':
+    main()
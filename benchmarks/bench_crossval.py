@@ -0,0 +1,55 @@
+"""
+Repeated k-fold by sklearn refits vs Gram-subtraction cross_validate
+
+    python -m benchmarks.bench_crossval [--rows N] [--features P] [--folds K] [--repeats R] [--workers W]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+
+from analysis.crossval import cross_validate, fold_ids
+
+
+def refits(x, y, k, repeats, seed):
+    scores = []
+    for repeat in range(repeats):
+        ids = fold_ids(len(x), k, seed + repeat)
+        for fold in range(k):
+            test = ids == fold
+            model = LinearRegression().fit(x[~test], y[~test])
+            residual = y[test] - model.predict(x[test])
+            scores.append((residual ** 2).mean())
+    return np.array(scores)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--features', type=int, default=60)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(args.rows, args.features))
+    y = x @ rng.normal(size=args.features) + rng.normal(size=args.rows)
+    frame = pd.DataFrame(x, columns=['x{}'.format(i) for i in range(args.features)])
+
+    start = time.perf_counter()
+    expected = refits(x, y, args.folds, args.repeats, 1)
+    base = time.perf_counter() - start
+    start = time.perf_counter()
+    result = cross_validate(frame, y, k=args.folds, repeats=args.repeats, workers=args.workers)
+    gram = time.perf_counter() - start
+    assert np.allclose(result.folds['mse'].to_numpy(), expected)
+    print('rows: {:,}  features: {}  folds: {} x {}'.format(args.rows, args.features, args.repeats, args.folds))
+    print('sklearn refits:  {:.3f}s'.format(base))
+    print('cross_validate:  {:.3f}s'.format(gram))
+    print(result.summary())
+
+
+if __name__ == '__main__':
+    main()
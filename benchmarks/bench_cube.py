@@ -0,0 +1,50 @@
+"""
+Row-scanning groupby vs PickupCube roll-ups
+
+    python -m benchmarks.bench_cube [--rows N]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from analysis.cleaning import clean_pickups
+from analysis.cube import PickupCube
+from analysis.loader import load_pickups
+from analysis.synthetic import write_csv
+
+QUERIES = [(['borough', 'hday'], 'mean'), ('start_month', 'sum'), ('start_day', 'sum'),
+           ('start_hour', 'sum'), ('week_day', 'sum'), (['start_hour', 'borough'], 'sum')]
+
+
+def per_call(func, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'pickups.csv')
+        write_csv(path, args.rows)
+        df = clean_pickups(load_pickups(path))
+
+    start = time.perf_counter()
+    cube = PickupCube().update(df)
+    print('cube build: {:.1f} ms for {:,} rows'.format((time.perf_counter() - start) * 1e3, len(df)))
+    print('{:<28}{:>14}{:>14}'.format('query', 'groupby ms', 'cube ms'))
+    for by, stat in QUERIES:
+        scan = per_call(lambda: df.groupby(by, observed=True)['pickups'].agg(stat))
+        cube.rollup(by, stat)
+        cached = per_call(lambda: cube.rollup(by, stat), repeat=200)
+        print('{:<28}{:>14.3f}{:>14.3f}'.format('{} {}'.format(stat, by), scan, cached))
+    batch = df.iloc[:24]
+    print('update with 24 rows: {:.3f} ms'.format(per_call(lambda: cube.update(batch))))
+
+
+if __name__ == '__main__':
+    main()
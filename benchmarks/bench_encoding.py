@@ -0,0 +1,48 @@
+"""
+pd.get_dummies vs a fitted CategoricalEncoder on borough x hour
+
+    python -m benchmarks.bench_encoding [--rows N]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis.encoding import CategoricalEncoder
+
+BOROUGHS = ['Bronx', 'Brooklyn', 'EWR', 'Manhattan', 'Queens', 'Staten Island', 'Unknown']
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'borough': pd.Categorical.from_codes(rng.integers(0, len(BOROUGHS), args.rows), BOROUGHS),
+                       'start_hour': rng.integers(0, 24, args.rows).astype(np.int8)})
+
+    def dummies():
+        key = df['borough'].astype(str) + '_' + df['start_hour'].astype(str)
+        return pd.get_dummies(key, dtype=np.uint8)
+
+    encoder = CategoricalEncoder([('borough', 'start_hour')]).fit(df)
+    base, expected = timed(dummies)
+    dense, result = timed(lambda: encoder.transform(df))
+    sparse, matrix = timed(lambda: encoder.transform(df, sparse=True))
+    assert result.sum() == len(df) and matrix.nnz == len(df)
+    print('rows: {:,}  columns: {}'.format(args.rows, result.shape[1]))
+    print('get_dummies on combined strings: {:.3f}s  {:>8.1f} MB'.format(base, expected.memory_usage().sum() / 2 ** 20))
+    print('encoder dense uint8:             {:.3f}s  {:>8.1f} MB'.format(dense, result.nbytes / 2 ** 20))
+    print('encoder sparse csr:              {:.3f}s  {:>8.1f} MB'.format(
+        sparse, (matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Notebook "Extracting date parts" cell vs analysis.features.extract_date_parts
+
+    python -m benchmarks.bench_features [--rows N]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis.features import extract_date_parts
+
+
+def notebook_cell(df):
+    df['start_year'] = df.pickup_dt.dt.year
+    df['start_month'] = df.pickup_dt.dt.month_name()
+    df['start_hour'] = df.pickup_dt.dt.hour
+    df['start_day'] = df.pickup_dt.dt.day
+    df['week_day'] = df.pickup_dt.dt.day_name()
+    return df
+
+
+def timed(func, df, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        frame = df.copy()
+        start = time.perf_counter()
+        func(frame)
+        best = min(best, time.perf_counter() - start)
+    return best, frame
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    hours = rng.integers(0, 10 * 365 * 24, args.rows)
+    df = pd.DataFrame({'pickup_dt': pd.Timestamp('2015-01-01') + pd.to_timedelta(hours, unit='h')})
+
+    base, expected = timed(notebook_cell, df, args.repeat)
+    fast, result = timed(extract_date_parts, df, args.repeat)
+    for col in ['start_year', 'start_hour', 'start_day']:
+        assert (expected[col].values == result[col].values).all(), col
+    for col in ['start_month', 'week_day']:
+        assert (expected[col].values == result[col].astype(str).values).all(), col
+    assert (df.pickup_dt.dt.daysinmonth.values == result['daysinmonth'].values).all()
+    assert (df.pickup_dt.dt.dayofweek.values == result['dayofweek'].values).all()
+
+    print('rows: {:,}'.format(args.rows))
+    print('notebook cell:       {:.3f}s'.format(base))
+    print('extract_date_parts:  {:.3f}s  ({:.1f}x)'.format(fast, base / fast))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Peak RSS and wall time of the untyped notebook read vs analysis.loader
+
+    python -m benchmarks.bench_loader [csv] [--rows N]
+
+Without a csv a synthetic file of --rows rows is written to a temp dir.
+Every variant runs in its own interpreter so the peak RSS numbers do not
+leak into each other.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from analysis.synthetic import write_csv
+
+VARIANTS = ['untyped', 'typed', 'chunked']
+
+
+def run_variant(variant, path):
+    from analysis.loader import CHUNKSIZE, load_pickups, read_pickups
+    start = time.perf_counter()
+    if variant == 'untyped':
+        data = pd.read_csv(path)
+        data['pickup_dt'] = pd.to_datetime(data['pickup_dt'], format="%d-%m-%Y %H:%M")
+        rows = len(data)
+    elif variant == 'typed':
+        rows = len(load_pickups(path))
+    else:
+        rows = sum(len(chunk) for chunk in read_pickups(path, chunksize=CHUNKSIZE))
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak *= 1024
+    print(variant, rows, seconds, peak)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('csv', nargs='?')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--run', choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run_variant(args.run, args.csv)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.csv
+        if path is None:
+            path = os.path.join(tmp, 'pickups.csv')
+            write_csv(path, args.rows)
+        print('{:<10}{:>12}{:>10}{:>14}'.format('variant', 'rows', 'seconds', 'peak RSS MB'))
+        for variant in VARIANTS:
+            out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_loader', path, '--run', variant],
+                                 check=True, capture_output=True, text=True).stdout.split()
+            print('{:<10}{:>12}{:>10.2f}{:>14.1f}'.format(out[0], int(out[1]), float(out[2]),
+                                                          int(out[3]) / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
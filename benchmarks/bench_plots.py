@@ -0,0 +1,70 @@
+"""
+Notebook seaborn calls vs the aggregate-first helpers in analysis.plots
+
+    python -m benchmarks.bench_plots [--rows 1000000 10000000]
+"""
+import argparse
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+from analysis import plots
+from analysis.features import extract_date_parts
+
+BOROUGHS = ['Bronx', 'Brooklyn', 'EWR', 'Manhattan', 'Queens', 'Staten Island', 'Unknown']
+
+CHARTS = {
+    'month': (lambda df: sns.lineplot(data=df, x="start_month", y="pickups", errorbar=None, estimator='sum'),
+              lambda df: plots.lineplot(df, x="start_month", y="pickups", ci=False, estimator='sum')),
+    'day': (lambda df: sns.lineplot(data=df, x="start_day", y="pickups", estimator='sum', errorbar=None),
+            lambda df: plots.lineplot(df, x="start_day", y="pickups", estimator='sum', ci=False)),
+    'hour': (lambda df: sns.lineplot(data=df, x="start_hour", y="pickups", estimator='sum', errorbar=None),
+             lambda df: plots.lineplot(df, x="start_hour", y="pickups", estimator='sum', ci=False)),
+    'weekday': (lambda df: sns.lineplot(data=df, x="week_day", y="pickups", errorbar=None, estimator='sum'),
+                lambda df: plots.lineplot(df, x="week_day", y="pickups", ci=False, estimator='sum')),
+    'hour x borough': (lambda df: sns.lineplot(data=df, x="start_hour", y="pickups", hue='borough',
+                                               estimator='sum', errorbar=None),
+                       lambda df: plots.lineplot(df, x="start_hour", y="pickups", hue='borough',
+                                                 estimator='sum', ci=False)),
+    'hday bar': (lambda df: sns.catplot(x='hday', y='pickups', data=df, kind="bar", estimator=np.sum),
+                 lambda df: plots.catplot(df, x='hday', y='pickups', kind="bar", estimator=np.sum)),
+}
+
+
+def make_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'pickup_dt': pd.Timestamp('2015-01-01') + pd.to_timedelta(rng.integers(0, 181 * 24, rows),
+                                                                               unit='h'),
+                       'borough': pd.Categorical.from_codes(rng.integers(0, len(BOROUGHS), rows), BOROUGHS),
+                       'pickups': rng.poisson(300, rows).astype(np.int32),
+                       'hday': pd.Categorical.from_codes((rng.random(rows) < 0.04).astype(np.int8), ['N', 'Y'])})
+    return extract_date_parts(df, drop=True)
+
+
+def timed(draw, df):
+    start = time.perf_counter()
+    result = draw(df)
+    figure = result.figure if hasattr(result, 'figure') else result.fig
+    figure.canvas.draw()
+    plt.close('all')
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    args = parser.parse_args()
+    print('{:>10}  {:<16}{:>12}{:>12}'.format('rows', 'chart', 'seaborn s', 'helper s'))
+    for rows in args.rows:
+        df = make_frame(rows)
+        for name, (before, after) in CHARTS.items():
+            print('{:>10,}  {:<16}{:>12.3f}{:>12.3f}'.format(rows, name, timed(before, df), timed(after, df)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Wall time and peak memory of the notebook's stages by data size, tracked
+across runs
+
+    python -m benchmarks.bench_scaling [--rows 1000000 10000000 100000000]
+                                       [--data .bench/data] [--history .bench/scaling.jsonl]
+                                       [--threshold 1.25] [--window 5] [--no-record]
+
+Each size is a synthetic file from analysis.synthetic, written once into
+--data and reused by later runs. Every size runs in its own interpreter,
+so peak RSS does not leak from one size into the next, with
+analysis.profiling recording the stages
+
+    load, date_parts, impute, groupby, correlation, plot
+
+Each run is appended to --history (json lines: run time, commit, machine,
+rows, stage, seconds and memory). A stage is compared with the median of
+its last --window runs of the same size on the same machine and flagged
+as a regression when it is --threshold times slower and at least
+MIN_SECONDS slower (timer noise on tiny stages is not a regression); any
+regression makes the exit status 1.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+from analysis import profiling
+
+MIN_SECONDS = 0.05
+GROUPINGS = [['borough'], ['borough', 'hday'], ['start_month'], ['week_day', 'start_hour'],
+             ['borough', 'start_month', 'start_hour']]
+
+
+def run_stages(path):
+    """The notebook's steps over one file, each one a profiling stage"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    from analysis.cleaning import add_date_parts
+    from analysis.correlation import NUM_VAR, CorrelationAccumulator
+    from analysis.impute import PICKUP_SPEC, Imputer
+    from analysis.loader import load_pickups
+    from analysis.plots import aggregate, histogram_boxplot_batch, lineplot
+
+    with profiling.stage('load') as step:
+        df = load_pickups(path)
+        step.rows = len(df)
+    with profiling.stage('date_parts', rows=len(df)):
+        df = add_date_parts(df)
+    with profiling.stage('impute', rows=len(df)):
+        df = Imputer(PICKUP_SPEC).fit_transform(df)
+    with profiling.stage('groupby', rows=len(df)):
+        for by in GROUPINGS:
+            aggregate(df, by, 'pickups', 'mean')
+    with profiling.stage('correlation', rows=len(df)):
+        CorrelationAccumulator(NUM_VAR).update(df).corr()
+    with profiling.stage('plot', rows=len(df)):
+        figure, _ = histogram_boxplot_batch(df, NUM_VAR)
+        figure.savefig(os.devnull, format='png')
+        plt.close(figure)
+        figure, ax = plt.subplots()
+        lineplot(df, 'start_hour', hue='borough', estimator='sum', ax=ax)
+        figure.savefig(os.devnull, format='png')
+        plt.close(figure)
+
+
+def dataset(directory, rows, seed=0):
+    """Path of the synthetic file of rows rows, written on first use"""
+    from analysis.synthetic import write_csv
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'pickups-{}-{}.csv'.format(rows, seed))
+    if not os.path.exists(path):
+        write_csv(path + '.tmp', rows, seed)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def machine():
+    return '{} {} cpus python {}'.format(platform.platform(), os.cpu_count(), platform.python_version())
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], check=True, capture_output=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(path, rows):
+    """Top-level stage records of one file, run in a fresh interpreter"""
+    with tempfile.TemporaryDirectory() as tmp:
+        log = os.path.join(tmp, 'profile.jsonl')
+        subprocess.run([sys.executable, '-m', 'benchmarks.bench_scaling', '--run', path, '--log', log], check=True)
+        records = profiling.read_log(log)
+    records = records[records['path'] == records['stage']]
+    return pd.DataFrame({'rows': rows, 'stage': records['stage'], 'wall_s': records['wall_s'],
+                         'cpu_s': records['cpu_s'], 'peak_rss_mb': records['rss_mb'] + records['peak_rss_delta_mb'],
+                         'peak_rss_delta_mb': records['peak_rss_delta_mb']})
+
+
+def read_history(path):
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=['run', 'commit', 'machine', 'rows', 'stage', 'wall_s'])
+    return profiling.read_log(path)
+
+
+def compare(current, history, window, threshold):
+    """current with the median wall seconds of earlier runs and a regression flag"""
+    previous = history[history['machine'] == machine()]
+    baseline = {}
+    for (rows, name), runs in previous.groupby(['rows', 'stage']):
+        baseline[rows, name] = runs.sort_values('run')['wall_s'].tail(window).median()
+    current = current.copy()
+    current['baseline_s'] = [baseline.get((rows, name)) for rows, name in zip(current['rows'], current['stage'])]
+    current['ratio'] = current['wall_s'] / current['baseline_s'].astype(float)
+    current['regression'] = (current['ratio'] > threshold) & (current['wall_s'] - current['baseline_s'] > MIN_SECONDS)
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000, 100_000_000])
+    parser.add_argument('--data', default=os.path.join('.bench', 'data'))
+    parser.add_argument('--history', default=os.path.join('.bench', 'scaling.jsonl'))
+    parser.add_argument('--threshold', type=float, default=1.25)
+    parser.add_argument('--window', type=int, default=5)
+    parser.add_argument('--no-record', action='store_true', help="compare without appending to the history")
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--log', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        profiling.enable(args.log)
+        run_stages(args.run)
+        profiling.disable()
+        return
+
+    results = []
+    for rows in args.rows:
+        results.append(measure(dataset(args.data, rows), rows))
+    current = pd.concat(results, ignore_index=True)
+    table = compare(current, read_history(args.history), args.window, args.threshold)
+    print('machine: {}  commit: {}'.format(machine(), commit()))
+    print('{:>12} {:<12}{:>10}{:>12}{:>12}{:>12}{:>8}'.format('rows', 'stage', 'seconds', 'rows/s', 'peak MB',
+                                                             'baseline', 'ratio'))
+    for row in table.itertuples():
+        print('{:>12,} {:<12}{:>10.2f}{:>12,.0f}{:>12.1f}{:>12}{:>8}{}'.format(
+            row.rows, row.stage, row.wall_s, row.rows / row.wall_s, row.peak_rss_mb,
+            '' if pd.isna(row.baseline_s) else '{:.2f}'.format(row.baseline_s),
+            '' if pd.isna(row.ratio) else '{:.2f}'.format(row.ratio), '  REGRESSION' if row.regression else ''))
+    if not args.no_record:
+        os.makedirs(os.path.dirname(args.history) or '.', exist_ok=True)
+        run, revision = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'), commit()
+        with open(args.history, 'a') as handle:
+            for row in current.to_dict('records'):
+                handle.write(json.dumps(dict(run=run, commit=revision, machine=machine(), **row)) + '\n')
+    if table['regression'].any():
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
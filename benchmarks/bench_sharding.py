@@ -0,0 +1,50 @@
+"""
+ShardedRunner wall time by worker count over many regions
+
+    python -m benchmarks.bench_sharding [--rows N] [--regions R] [--workers 1 2 4 8]
+
+The sample file's boroughs are relabelled into --regions regions, as if
+many more cities than NYC were loaded.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from analysis.cleaning import add_date_parts, clean_pickups, fill_borough
+from analysis.impute import PICKUP_SPEC, Imputer
+from analysis.loader import load_pickups
+from analysis.sharding import ShardedRunner, aggregate_stage, cube_stage
+from analysis.synthetic import write_csv
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--regions', type=int, default=32)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sample.csv')
+        write_csv(path, args.rows)
+        df = clean_pickups(load_pickups(path), [add_date_parts, fill_borough])
+    rng = np.random.default_rng(0)
+    df['borough'] = (df['borough'].astype(str) + '-' + rng.integers(0, args.regions // 7 + 1, len(df)).astype(str))
+    df['borough'] = df['borough'].astype('category')
+    print('rows: {:,}  regions: {}  cpus: {}'.format(len(df), df['borough'].nunique(), os.cpu_count()))
+    base = None
+    for workers in args.workers:
+        with ShardedRunner(df, workers=workers) as runner:
+            start = time.perf_counter()
+            runner.impute(Imputer(PICKUP_SPEC))
+            runner.run(cube_stage)
+            runner.run(aggregate_stage, ['borough', 'hday', 'start_hour'], 'pickups', 'mean')
+            seconds = time.perf_counter() - start
+        base = base or seconds
+        print('workers {:>2}: {:.2f}s  speedup {:.2f}x'.format(workers, seconds, base / seconds))
+
+
+if __name__ == '__main__':
+    main()
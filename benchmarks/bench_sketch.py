@@ -0,0 +1,69 @@
+"""
+Exact quantiles vs KLL sketches for the boxplot statistics
+
+    python -m benchmarks.bench_sketch [--rows N] [--chunks C] [--k K]
+
+Reports build time, quantile time and the worst normalized rank error of
+Q1/median/Q3 and of the 1.5 x IQR outlier fences.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from analysis.sketch import ColumnSketches
+
+QS = [0.25, 0.5, 0.75]
+
+
+def make_columns(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return {'pickups': rng.lognormal(5, 1.2, rows).round(),
+            'temp': rng.normal(45, 18, rows),
+            'pcp01': np.where(rng.random(rows) < 0.9, 0.0, rng.exponential(0.05, rows))}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--chunks', type=int, default=100)
+    parser.add_argument('--k', type=int, default=200)
+    args = parser.parse_args()
+    import pandas as pd
+    frame = pd.DataFrame(make_columns(args.rows))
+
+    start = time.perf_counter()
+    exact = {col: np.quantile(frame[col].to_numpy(), QS) for col in frame}
+    exact_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parts = []
+    for chunk in np.array_split(np.arange(args.rows), args.chunks):
+        parts.append(ColumnSketches(frame.columns, k=args.k, seed=len(parts)).update(frame.iloc[chunk]))
+    sketches = parts[0]
+    for part in parts[1:]:
+        sketches.merge(part)
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    approx = sketches.quantiles(QS)
+    query_seconds = time.perf_counter() - start
+
+    print('rows: {:,}  chunks: {}  k: {}'.format(args.rows, args.chunks, args.k))
+    print('exact np.quantile: {:.3f}s   sketch build+merge: {:.3f}s   query: {:.4f}s'.format(
+        exact_seconds, build_seconds, query_seconds))
+    print('{:<10}{:>16}{:>16}'.format('column', 'max rank error', 'fence error'))
+    for col in frame:
+        ordered = np.sort(frame[col].to_numpy())
+        # with ties a value covers a range of ranks, the error is the distance to it
+        left = np.searchsorted(ordered, approx[col].to_numpy(), side='left') / len(ordered)
+        right = np.searchsorted(ordered, approx[col].to_numpy(), side='right') / len(ordered)
+        error = np.maximum(0, np.maximum(left - QS, np.asarray(QS) - right)).max()
+        fences = sketches.fences().loc[col]
+        q1, _, q3 = exact[col]
+        exact_fences = np.array([q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)])
+        fence_error = np.abs(fences.to_numpy() - exact_fences).max() / (q3 - q1 or 1)
+        print('{:<10}{:>16.4%}{:>16.4f}'.format(col, error, fence_error))
+
+
+if __name__ == '__main__':
+    main()
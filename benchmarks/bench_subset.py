@@ -0,0 +1,59 @@
+"""
+Subset search from 8 to 30 regressors: sweeps vs refitting every subset
+
+    python -m benchmarks.bench_subset [--rows N] [--max-exhaustive P]
+
+Refit times are measured on a sample of subsets and scaled to 2^p.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis.ols import OLSAccumulator
+from analysis.subset import exhaustive, stepwise
+
+SIZES = [8, 12, 16, 20, 24, 30]
+SAMPLE = 200
+
+
+def refit_seconds(x, y, p, rng):
+    masks = rng.integers(1, 1 << p, SAMPLE)
+    start = time.perf_counter()
+    for mask in masks:
+        columns = [j for j in range(p) if mask >> j & 1]
+        design = np.hstack([np.ones((len(x), 1)), x[:, columns]])
+        np.linalg.lstsq(design, y, rcond=None)
+    return (time.perf_counter() - start) / SAMPLE * (1 << p)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=5_000)
+    parser.add_argument('--max-exhaustive', type=int, default=20)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    rows = []
+    for p in SIZES:
+        x = rng.normal(size=(args.rows, p))
+        y = x[:, :p // 2] @ rng.normal(size=p // 2) + rng.normal(size=args.rows)
+        frame = pd.DataFrame(x, columns=['x{}'.format(j) for j in range(p)])
+        accumulator = OLSAccumulator().update(frame, y)
+        row = {'features': p, 'subsets': 1 << p, 'refit_s (scaled)': refit_seconds(x, y, p, rng)}
+        if p <= args.max_exhaustive:
+            start = time.perf_counter()
+            best = exhaustive(accumulator, top=1)
+            row['exhaustive_s'] = time.perf_counter() - start
+            row['best_size'] = best['size'].iloc[0]
+        for direction in ('forward', 'backward'):
+            start = time.perf_counter()
+            path = stepwise(accumulator, direction=direction)
+            row[direction + '_s'] = time.perf_counter() - start
+            row[direction + '_size'] = path['size'].iloc[-1]
+        rows.append(row)
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import math
+from fractions import Fraction
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis.correlation import CorrelationAccumulator
+
+COLUMNS = ['pickups', 'temp', 'slp', 'flat', 'pcp01']
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    n = 5_000
+    temp = rng.normal(50, 15, n)
+    df = pd.DataFrame({'pickups': rng.poisson(300, n) + 4 * temp,
+                       'temp': temp,
+                       # large offset, small spread: cancels out without the shift
+                       'slp': 1e6 + rng.normal(0, 0.01, n) + 1e-4 * temp,
+                       'flat': np.full(n, 7.0),
+                       'pcp01': np.where(rng.random(n) < 0.1, rng.exponential(0.05, n), 0.0)})
+    df.loc[rng.random(n) < 0.1, 'temp'] = np.nan
+    df.loc[rng.random(n) < 0.05, 'pickups'] = np.nan
+    df.loc[1000:1499, 'pcp01'] = np.nan
+    return df
+
+
+def chunks(df, parts):
+    bounds = np.linspace(0, len(df), parts + 1).astype(int)
+    return [df.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def assert_matches(accumulator, df):
+    # pandas' own sums lose digits on the 1e6-offset column; removing the
+    # means first changes neither matrix and gives it full precision
+    centered = df - df.mean()
+    pd.testing.assert_frame_equal(accumulator.corr(), centered.corr(), rtol=1e-9, atol=1e-12)
+    pd.testing.assert_frame_equal(accumulator.cov(), centered.cov(), rtol=1e-9, atol=1e-12)
+    pd.testing.assert_frame_equal(accumulator.count(), df.notna().astype(np.int64).T @ df.notna().astype(np.int64))
+
+
+def test_whole_frame(frame):
+    assert_matches(CorrelationAccumulator(COLUMNS).update(frame), frame)
+
+
+def test_large_offset_column(frame):
+    pair = frame[['slp', 'temp']].dropna()
+    x, y = [[Fraction(value) for value in pair[col]] for col in pair]
+    mx, my = sum(x) / len(x), sum(y) / len(y)
+    sxy = sum((a - mx) * (b - my) for a, b in zip(x, y))
+    sxx, syy = sum((a - mx) ** 2 for a in x), sum((b - my) ** 2 for b in y)
+    exact = float(sxy) / math.sqrt(float(sxx) * float(syy))
+    corr = CorrelationAccumulator(COLUMNS).update(frame).corr()
+    assert corr.loc['slp', 'temp'] == pytest.approx(exact, rel=1e-12)
+    assert corr.loc['slp', 'temp'] == pytest.approx(frame.corr().loc['slp', 'temp'], rel=1e-6)
+
+
+def test_constant_column_is_nan(frame):
+    corr = CorrelationAccumulator(COLUMNS).update(frame).corr()
+    assert corr['flat'].isna().all()
+    assert corr.loc['flat'].isna().all()
+
+
+def test_chunked_update(frame):
+    accumulator = CorrelationAccumulator(COLUMNS)
+    for chunk in chunks(frame, 7):
+        accumulator.update(chunk)
+    assert_matches(accumulator, frame)
+
+
+def test_merge(frame):
+    parts = [CorrelationAccumulator(COLUMNS).update(chunk) for chunk in chunks(frame, 4)]
+    merged = CorrelationAccumulator(COLUMNS)
+    for part in parts:
+        merged.merge(part)
+    assert_matches(merged, frame)
+
+
+def test_merge_shifted_partitions(frame):
+    # partitions whose first-batch means (the shifts) differ a lot
+    low, high = frame.iloc[:2_500].copy(), frame.iloc[2_500:].copy()
+    high['slp'] += 50.0
+    data = pd.concat([low, high])
+    merged = CorrelationAccumulator(COLUMNS).update(low).merge(CorrelationAccumulator(COLUMNS).update(high))
+    assert_matches(merged, data)
+
+
+def test_min_periods(frame):
+    small = frame.iloc[:3]
+    pd.testing.assert_frame_equal(CorrelationAccumulator(COLUMNS).update(small).corr(min_periods=3),
+                                  small.corr(min_periods=3))
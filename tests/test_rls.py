@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from analysis.rls import RecursiveLeastSquares
+
+NAMES = ['temp', 'spd', 'sd']
+
+
+def stream(hours=2_000, rows=6, seed=0):
+    """Hourly batches whose temp effect changes halfway, with sd stuck at zero"""
+    rng = np.random.default_rng(seed)
+    batches = []
+    for hour in range(hours):
+        x = np.column_stack([rng.normal(50, 15, rows), rng.gamma(3, 2, rows), np.zeros(rows)])
+        slope = 4.0 if hour < hours // 2 else -2.0
+        y = 300 + slope * x[:, 0] + 10 * x[:, 1] + rng.normal(0, 20, rows)
+        batches.append((x, y))
+    return batches
+
+
+def windowed_ols(batches, forgetting):
+    """Least squares with every batch weighted forgetting ** (batches after it)"""
+    x = np.vstack([np.column_stack([np.ones(len(bx)), bx[:, :2]]) for bx, _ in batches])
+    y = np.concatenate([by for _, by in batches])
+    ages = np.concatenate([np.full(len(by), len(batches) - 1 - i) for i, (_, by) in enumerate(batches)])
+    weight = np.sqrt(forgetting ** ages)
+    return np.linalg.lstsq(x * weight[:, None], y * weight, rcond=None)[0]
+
+
+def test_forgetting_stays_bounded_with_an_unexcited_column():
+    batches = stream()
+    model = RecursiveLeastSquares(NAMES, forgetting=0.99)
+    for x, y in batches:
+        model.update(x, y)
+        assert np.isfinite(model.p).all()
+        assert np.abs(model.p).max() <= model.delta * (1 + 1e-9)
+    coefficients = model.coefficients
+    assert coefficients['sd'] == 0
+    expected = windowed_ols(batches, 0.99)
+    np.testing.assert_allclose(coefficients[['Intercept', 'temp', 'spd']], expected, rtol=0.02)
+    assert coefficients['temp'] == pytest.approx(-2.0, abs=0.2)
+
+
+def test_forgetting_counts_update_calls_not_rows():
+    few, many = stream(hours=300, rows=2, seed=1), stream(hours=300, rows=12, seed=1)
+    for batches in (few, many):
+        model = RecursiveLeastSquares(NAMES, forgetting=0.95)
+        for x, y in batches:
+            model.update(x, y)
+        np.testing.assert_allclose(model.coefficients[['Intercept', 'temp', 'spd']], windowed_ols(batches, 0.95),
+                                   rtol=0.05)
+
+
+def test_no_forgetting_matches_ols():
+    batches = stream(hours=200)
+    model = RecursiveLeastSquares(NAMES[:2], delta=1e8)
+    for x, y in batches:
+        model.update(x[:, :2], y)
+    np.testing.assert_allclose(model.coefficients, windowed_ols(batches, 1.0), rtol=1e-4)
+
+
+def test_checkpoint_resumes_exactly(tmp_path):
+    batches = stream(hours=50)
+    model = RecursiveLeastSquares(NAMES, forgetting=0.99)
+    for x, y in batches[:25]:
+        model.update(x, y)
+    model.save(tmp_path / 'rls.json')
+    resumed = RecursiveLeastSquares.load(tmp_path / 'rls.json')
+    for x, y in batches[25:]:
+        model.update(x, y)
+        resumed.update(x, y)
+    np.testing.assert_array_equal(model.theta, resumed.theta)
+    assert len(resumed.drift()) == 50